@@ -30,9 +30,11 @@ from pynogram.animation import (
     CursesRenderer,
     StringsPager,
 )
+from pynogram.core import backtracking
 from pynogram.core.board import make_board
 from pynogram.core.common import BOX
 from pynogram.core.backtracking import Solver
+from pynogram.core.line.base import persist_caches
 from pynogram.core.renderer import BaseAsciiRenderer
 from pynogram.reader import (
     read_example, example_file,
@@ -69,6 +71,13 @@ def cli_args():
     parser.add_argument('--max-depth', type=int,
                         help='try to solve without getting too deep into search')
 
+    parser.add_argument('--jobs', '-j', type=int,
+                        help='probe the cells in that many processes '
+                             '(pays off only on the large boards)')
+
+    parser.add_argument('--cache-file',
+                        help='keep the solved lines in the file between the runs')
+
     parser.add_argument('--verbose', '-v', action='count',
                         help='increase logging level')
 
@@ -230,6 +239,12 @@ def main():
 
     _setup_logs(log_level(args.verbose))
 
+    if args.cache_file:
+        persist_caches(args.cache_file)
+
+    if args.jobs:
+        backtracking.PROBING_PROCESSES = args.jobs
+
     if args.pbn:
         board_def = Pbn.read(args.pbn)
     elif args.local_pbn:
@@ -3,25 +3,28 @@
 
 from __future__ import unicode_literals, print_function
 
+import heapq
 import logging
+import multiprocessing
+import random
 import time
 from collections import (
     OrderedDict,
     defaultdict,
     deque,
 )
-from itertools import product
+from operator import itemgetter
 
-from six import iteritems
-from six.moves import range
+from six.moves import range, map
 
 from pynogram.core import propagation
-from pynogram.core.board import (
-    CellPosition, CellState,
-)
+from pynogram.core.board import CellState
 from pynogram.core.common import NonogramError
 from pynogram.core.line.base import cache_info
+from pynogram.core.line.bgu import BguSolver
+from pynogram.utils.cache import Cache
 from pynogram.utils.iter import expand_generator
+from pynogram.utils.other import terminating_mp_pool
 from pynogram.utils.priority_dict import PriorityDict
 
 LOG = logging.getLogger(__name__)
@@ -36,8 +39,86 @@ FEW_COLORS_FIRST = False
 # to adjust its rate when choosing the next probe for DFS
 ADJUST_RATE = True
 
+# the fewer ways to solve the row and the column of a cell
+# the earlier it appears in a list of candidates
+# (minimum remaining values, for the black-and-white boards only)
+MRV_CANDIDATES = False
+
+# consider only that many best cells as the candidates for the search
+# (None means to try all the unsolved cells)
+MAX_CANDIDATES = None
+
+# stop the round of probes after that many probes in a row
+# did not find any contradiction (None means to probe all the jobs)
+MAX_FRUITLESS_PROBES = None
+
+# the number of processes to use for the rounds of probes
+# (0 or 1 means to probe everything in the current process)
+PROBING_PROCESSES = 0
+
+# the parallel probing only pays off on the large boards
+PARALLEL_PROBING_MIN_CELLS = 256
+
+# remember the results of that many probes made on the same board
+# (the search tries the same assumptions on the same boards over and over again)
+PROBES_CACHE_SIZE = 10 ** 5
+
+# remember the probing priorities of the cells for that many boards
+# (the search levels start every guess from the same board)
+PRIORITIES_CACHE_SIZE = 100
+
+# when a search path is found to be a dead end, check whether
+# its shorter prefixes are dead ends too and return straight to them
+BACKJUMPING = True
+
+# do not probe the cells with all the neighbours unsolved and the sum
+# of the solution rates of their row and column below that value:
+# such probes rarely find anything (None means to probe all the cells)
+SKIP_LOW_RATED = 0.2
+
+# do not try the search paths that include all the assumptions
+# of some path already found to be a dead end (in any order)
+PRUNE_DEAD_ENDS = False
+
+# remember the results of the search for that many boards
+# (different search paths can lead to the same board)
+EXPLORED_STATES_CACHE_SIZE = 10 ** 4
+
+# the board to probe in the worker processes
+# (the workers inherit it from the parent process on fork)
+_PROBING_BOARD = None
+
+
+def _find_contradictions(positions):
+    """
+    Probe all the colors of the given cells on the inherited board
+    and return the states that lead to the contradiction.
+
+    The board always restores after the probe, so every found state
+    is a contradiction for the board the parent process has started with.
+    """
+    board = _PROBING_BOARD
+    # do not draw anything from the workers
+    board.on_row_update = board.on_column_update = None
+    solver = Solver(board)
+
+    contradictions = []
+    for pos in positions:
+        if board.is_cell_solved(pos):
+            continue
+
+        for color in board.cell_colors(pos):
+            state = CellState.from_position(pos, color)
+            if solver.leads_to_contradiction(state):
+                contradictions.append(state)
+
+    return contradictions
+
 
 class _SearchNode(object):
+    # a node is created for every state tried in the search
+    __slots__ = ['value', 'children']
+
     def __init__(self, value):
         self.value = value
         self.children = OrderedDict()
@@ -52,7 +133,7 @@ class _SearchNode(object):
             'value': self.value,
             'children': OrderedDict(
                 (str(k), v.to_dict())
-                for k, v in iteritems(self.children)
+                for k, v in self.children.items()
             )
         }
 
@@ -67,6 +148,12 @@ class Solver(object):
         :type board: Board
         """
         self.board = board
+        # do not choose the line solvers on every probe
+        self._methods = propagation.default_methods(board)
+        self._probes_cache = Cache(PROBES_CACHE_SIZE, lru=True)
+        self._priorities_cache = Cache(PRIORITIES_CACHE_SIZE, lru=True)
+        # the fingerprint of the board -> (depth, result) of its search
+        self._explored_states = Cache(EXPLORED_STATES_CACHE_SIZE, lru=True)
 
         self.max_solutions = max_solutions
         self.timeout = timeout
@@ -87,9 +174,21 @@ class Solver(object):
 
         self.depth_reached = 0
         self.start_time = None
+        # the keys of the explored paths (see `_path_key`)
         self.explored_paths = set()
+        # the random keys of the states of the cells
+        self._state_keys = {}
+        self._random = random.Random(0)
         self.search_map = None
 
+        # the trail checkpoints of the search levels made before their guesses
+        self._guess_checkpoints = []
+        # all the search levels starting from this depth are dead ends
+        self._dead_depth = None
+        # the sets of the assumptions leading to the contradiction,
+        # indexed by their smallest assumption
+        self._dead_ends = defaultdict(set)
+
     def _add_search_result(self, path, score):
         if isinstance(score, float):
             score = round(score, 4)
@@ -117,6 +216,31 @@ class Solver(object):
 
         current.value = score
 
+    def _add_dead_end(self, path):
+        if not PRUNE_DEAD_ENDS or not path:
+            return
+
+        assumptions = frozenset(path)
+        self._dead_ends[min(assumptions)].add(assumptions)
+
+    def _is_dead_end(self, path):
+        """
+        Whether the given path includes all the assumptions of some dead end.
+        If the assumptions lead to the contradiction, then the more
+        assumptions (made in any order) lead to the contradiction too.
+        """
+        dead_ends = self._dead_ends
+        if not dead_ends:
+            return False
+
+        assumptions = frozenset(path)
+        for state in assumptions:
+            for dead_end in dead_ends.get(state, ()):
+                if dead_end <= assumptions:
+                    return True
+
+        return False
+
     def propagate_change(self, cell_state):
         """
         Set the given color to given cell
@@ -124,7 +248,7 @@ class Solver(object):
         :type cell_state: CellState
         """
         board = self.board
-        LOG.debug('Assume that (%i, %i) is %s', *tuple(cell_state))
+        LOG.debug('Assume that (%i, %i) is %s', *cell_state)
 
         board.set_color(cell_state)
 
@@ -132,9 +256,26 @@ class Solver(object):
             board,
             row_indexes=(cell_state.row_index,),
             column_indexes=(cell_state.column_index,),
-            contradiction_mode=True)
+            contradiction_mode=True, methods=self._methods)
+
+    def leads_to_contradiction(self, cell_state):
+        """
+        Whether the given assumption leads to the contradiction.
+        Nothing is changed on the board after the check.
+        """
+        board = self.board
+
+        board.start_trail()
+        try:
+            self.propagate_change(cell_state)
+        except NonogramError:
+            return True
+        finally:
+            board.rollback()
+
+        return False
 
-    def probe(self, cell_state, rollback=True, force=False):
+    def probe(self, cell_state, rollback=True, force=False, fingerprint=None):
         """
         Try to find if the given cell can be in an assumed state.
         If the contradiction is found, set the cell
@@ -143,17 +284,19 @@ class Solver(object):
         after the assumption was made.
         If `force`, try to solve it anyway, even if the cell is already solved
         (to rerun the line solver).
+        If the `fingerprint` of the current board is already known,
+        it is used to look up the results of the same probe made before.
 
         Return the pair `(is_contradiction, new_info)` where
 
         is_contradiction: whether the assumption led to a contradiction
 
         new_info:
-          a) when contradiction is found, it contains the state of the board
-          before any assumptions was made. It will help further to determine
-          which cells has changed on that probe.
+          a) when contradiction is found, it contains the positions of the cells
+          changed by the found contradiction (the inverted assumption).
           b) if no contradiction found, but `rollback` is False,
-          then we do not restore the board and return the previous state also.
+          then we do not restore the board and return the positions
+          of the cells changed by the assumption.
           c) otherwise it contains the number of solved cells for the partially
           solved board (if the assumption made is true)
         """
@@ -170,81 +313,152 @@ class Solver(object):
             LOG.warning("The probe is useless: color '%s' already unset", assumption)
             return False, None
 
-        save = board.make_snapshot()
+        cache_key = self._probe_cache_key(cell_state, rollback, fingerprint)
+        if cache_key is not None:
+            cached = self._probes_cache.get(cache_key)
+            if cached is not None:
+                return self._replay_probe(*cached)
 
+        # only the changed cells are saved
+        board.start_trail()
         try:
             solved_cells = self.propagate_change(cell_state)
         except NonogramError:
             LOG.debug('Contradiction', exc_info=True)
             # rollback solved cells
-            board.restore(save)
+            board.rollback()
 
         else:
             if board.is_solved_full:
                 self._add_solution()
 
             if rollback:
-                board.restore(save)
+                board.rollback()
+                if cache_key is not None:
+                    self._probes_cache.save(cache_key, (False, solved_cells, ()))
                 return False, solved_cells
 
-            return False, save
+            changed = board.stop_trail()
+            if cache_key is not None:
+                self._save_probe(cache_key, False, changed)
+            return False, changed
 
-        if USE_CONTRADICTION_RESULTS:
-            before_contradiction = board.make_snapshot()
-        else:
-            before_contradiction = None
+        # the changes made by the contradiction are recorded
+        # to find the next probes (and to replay them from the cache)
+        record_changes = USE_CONTRADICTION_RESULTS or cache_key is not None
+        if record_changes:
+            board.start_trail()
+        changed = None
 
         pos = cell_state.position
         LOG.info('Found contradiction at (%i, %i)', *pos)
         try:
-            board.unset_color(cell_state)
-        except ValueError as ex:
-            raise NonogramError(str(ex))
+            try:
+                board.unset_color(cell_state)
+            except ValueError as ex:
+                raise NonogramError(str(ex))
+
+            # try to solve with additional info
+            # solve with only one cell as new info
+            propagation.solve(
+                board,
+                row_indexes=(pos.row_index,),
+                column_indexes=(pos.column_index,),
+                methods=self._methods)
+        finally:
+            if record_changes:
+                changed = board.stop_trail()
 
-        # try to solve with additional info
-        # solve with only one cell as new info
-        propagation.solve(
-            board,
-            row_indexes=(pos.row_index,),
-            column_indexes=(pos.column_index,))
+        if cache_key is not None:
+            self._save_probe(cache_key, True, changed)
 
-        return True, before_contradiction
+        if not USE_CONTRADICTION_RESULTS:
+            changed = None
 
-    def _new_jobs_from_solution(self, cell_state, previous_board, is_contradiction):
+        return True, changed
+
+    def _probe_cache_key(self, cell_state, rollback, fingerprint=None):
+        """
+        The results of the probe depend on the whole board,
+        not only on the row and the column of the probed cell.
+        """
+        if not PROBES_CACHE_SIZE:
+            return None
+
+        board = self.board
+        # the callbacks can check (and change) something outside the board
+        if board.on_row_update or board.on_column_update:
+            return None
+
+        if fingerprint is None:
+            fingerprint = board.fingerprint()
+
+        return fingerprint, cell_state, rollback
+
+    def _save_probe(self, cache_key, is_contradiction, changed):
+        """Remember the cells changed by the probe along with their new values"""
+        cells = self.board.cells
+        changes = tuple(
+            (row_index, column_index, cells[row_index][column_index])
+            for row_index, column_index in changed)
+
+        self._probes_cache.save(cache_key, (is_contradiction, changed, changes))
+
+    def _replay_probe(self, is_contradiction, new_info, changes):
+        """Apply the changes of the probe made earlier on the same board"""
         board = self.board
+        for cell_state in changes:
+            board.set_color(cell_state)
+
+        if is_contradiction:
+            # as the propagation after the contradiction does
+            board.solution_round_completed()
+
+            if not USE_CONTRADICTION_RESULTS:
+                new_info = None
+
+        return is_contradiction, new_info
+
+    def _new_jobs_from_solution(self, cell_state, changed, is_contradiction):
+        """
+        The new jobs (with their priorities) to probe
+        after the given state have changed the cells.
+
+        The changed cells share a lot of neighbours, so the jobs are collected
+        into a dict first to push every job into the queue only once.
+        """
+        board = self.board
+
+        # add the neighbours of the changed cells into jobs
+        new_jobs = dict.fromkeys(board.unsolved_neighbours_of(changed), 1)
 
-        # evaluate generator
-        changed = list(board.changed(previous_board))
         assumption = cell_state.color
         log_contradiction = '(not) ' if is_contradiction else ''
         LOG.info('Changed %d cells with %s%s assumption',
                  len(changed), log_contradiction, assumption)
 
-        # add the neighbours of the changed cells into jobs
-        for pos in changed:
-            for neighbour in board.unsolved_neighbours(pos):
-                yield neighbour, 1
-
         # add the neighbours of the selected cell into jobs
         for neighbour in board.unsolved_neighbours(cell_state.position):
-            yield neighbour, 0
+            new_jobs[neighbour] = 0
+
+        return new_jobs
 
     def _set_guess(self, state):
         board = self.board
-        is_contradiction, prev_board = self.probe(state, rollback=False, force=True)
+        is_contradiction, changed = self.probe(state, rollback=False, force=True)
 
         if is_contradiction:
             raise NonogramError('Real contradiction was found: %s' % (state,))
 
-        if prev_board is None:
+        if changed is None:
             LOG.warning("The probe for state '%s' does not return anything new", state)
-            return ()
+            return {}
 
         if board.is_solved_full:
             self._add_solution()
-            return ()
+            return {}
 
-        return self._new_jobs_from_solution(state, prev_board, is_contradiction)
+        return self._new_jobs_from_solution(state, changed, is_contradiction)
 
     def _solve_jobs(self, jobs, refill=False):
         """
@@ -265,34 +479,68 @@ class Solver(object):
         processed_in_round = set()
         expired_assumptions = set()
 
+        # the probes are too many to check the logging level for each one
+        log_probes = LOG.isEnabledFor(logging.INFO)
+
+        # the probes without contradiction restore the board,
+        # so it only changes (and should be hashed again) after the contradiction
+        fingerprint = None
+
+        # the methods called for every probe
+        probe = self.probe
+        is_cell_solved = board.is_cell_solved
+        cell_colors = board.cell_colors
+        from_position = CellState.from_position
+        pop_smallest = jobs.pop_smallest
+
+        # every unsolved cell of the black-and-white board can be of both colors
+        unsolved_colors = None if board.is_colored else tuple(board.colors())
+
+        fruitless = 0
         while jobs:
-            state, priority = jobs.pop_smallest()
+            if MAX_FRUITLESS_PROBES and fruitless >= MAX_FRUITLESS_PROBES:
+                LOG.info('No contradictions found in the last %d probes', fruitless)
+                break
+
+            state, priority = pop_smallest()
             counter += 1
-            LOG.info('Probe #%d: %s (%f)', counter, state, priority)
+            fruitless += 1
+            if log_probes:
+                LOG.info('Probe #%d: %s (%f)', counter, state, priority)
 
             # if the job is only coordinates
             # then try all the possible colors
             pos = state[:2]
-            if len(state) == 2:
-                assumptions = board.cell_colors(state)
+            if is_cell_solved(pos):
+                # the cell was solved after the job had been added
+                assumptions = ()
+            elif len(state) == 2:
+                assumptions = unsolved_colors or cell_colors(state)
             else:
                 assumptions = (state.color,)
 
             for assumption in assumptions:
-                state = CellState.from_position(pos, assumption)
-                is_contradiction, info = self.probe(state)
+                state = from_position(pos, assumption)
+                if fingerprint is None and PROBES_CACHE_SIZE:
+                    fingerprint = board.fingerprint()
+                is_contradiction, info = probe(state, fingerprint=fingerprint)
+
+                if is_contradiction:
+                    # the board is changed even if the changes are not returned
+                    fingerprint = None
 
                 if info is None:
                     continue
 
                 if is_contradiction:
                     counter_found += 1
+                    fruitless = 0
                     if board.is_solved_full:
                         self._add_solution()
                         return counter_found, None
 
                     for new_job, priority in self._new_jobs_from_solution(
-                            state, info, is_contradiction):
+                            state, info, is_contradiction).items():
                         jobs[new_job] = priority
 
                     # All the jobs that was processed before the given
@@ -315,7 +563,7 @@ class Solver(object):
                             len(expired_assumptions))
                 refill_processed = self._get_all_unsolved_jobs(
                     choose_from_cells=expired_assumptions)
-                for new_job, priority in iteritems(refill_processed):
+                for new_job, priority in refill_processed.items():
                     jobs[new_job] = priority
 
                 # they are no longer expired, as they active now!
@@ -323,7 +571,34 @@ class Solver(object):
                 expired_assumptions = set()
                 counter = 0
 
-        return counter_found, self._probes_from_rates(rates)
+        candidates = self._probes_from_rates(rates)
+        if jobs:
+            # the round was stopped early, but the cells left unprobed
+            # can still be needed for the search to find all the solutions
+            candidates.extend(self._unprobed_candidates(jobs, candidates))
+
+        return counter_found, candidates
+
+    @expand_generator
+    def _unprobed_candidates(self, jobs, candidates):
+        """
+        The candidates for the search from the jobs left in the queue.
+        They have no rates, so they go after the probed candidates
+        in the order of the jobs priorities.
+        """
+        board = self.board
+        positions = set(state.position for state in candidates)
+
+        from_position = CellState.from_position
+        while jobs:
+            state, __ = jobs.pop_smallest()
+            pos = state[:2]
+            if pos in positions or board.is_cell_solved(pos):
+                continue
+
+            positions.add(pos)
+            for color in board.cell_colors(pos):
+                yield from_position(pos, color)
 
     def _add_solution(self):
         # force to check the board
@@ -333,11 +608,13 @@ class Solver(object):
     @expand_generator
     def _probes_from_rates(self, rates):
         jobs_with_rates = defaultdict(dict)
+        is_cell_solved = self.board.is_cell_solved
 
-        for cell_state, (rate, priority) in iteritems(rates):
-            pos = cell_state.position
-            color = cell_state.color
-            if self.board.is_cell_solved(pos):
+        # the states are unpacked instead of building
+        # the `CellPosition` for every one of them
+        for (row_index, column_index, color), (rate, priority) in rates.items():
+            pos = row_index, column_index
+            if is_cell_solved(pos):
                 continue
 
             # the more priority the less desired that job
@@ -347,44 +624,96 @@ class Solver(object):
             # if rate > jobs_with_rates.get(job, 0):
             jobs_with_rates[pos][color] = rate
 
-        max_rate = {pos: max(v.values()) for pos, v in iteritems(jobs_with_rates)}
+        max_rate = {pos: max(v.values()) for pos, v in jobs_with_rates.items()}
         # the biggest rate appears first
-        best = sorted(iteritems(max_rate), key=lambda x: x[1], reverse=True)
+        if MAX_CANDIDATES is None:
+            best = sorted(max_rate.items(), key=itemgetter(1), reverse=True)
+        else:
+            # the same order as the sorting, but without sorting the rest
+            best = heapq.nlargest(MAX_CANDIDATES, max_rate.items(), key=itemgetter(1))
+        if MRV_CANDIDATES and not self.board.is_colored and not self.board.has_blots:
+            # the rate is used to break the ties, since the sort is stable
+            placements = self._placements_numbers(max_rate)
+            best = sorted(best, key=lambda x: placements[x[0]])
         if FEW_COLORS_FIRST:
             best = sorted(best, key=lambda x: len(jobs_with_rates[x[0]]))
-        LOG.debug('\n'.join(map(str, best)))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug('\n'.join(map(str, best)))
 
+        from_position = CellState.from_position
         for pos, max_rate in best:
-            colors = sorted(iteritems(jobs_with_rates[pos]), key=lambda x: x[1], reverse=True)
+            colors = sorted(jobs_with_rates[pos].items(), key=itemgetter(1), reverse=True)
             for color, rate in colors:
-                yield CellState.from_position(pos, color)
+                yield from_position(pos, color)
 
-    def _get_all_unsolved_jobs(self, choose_from_cells=None):
+    def _placements_numbers(self, positions):
+        """
+        For every given cell find the number of ways to solve its row
+        multiplied by the number of ways to solve its column.
+        """
         board = self.board
+        row_numbers, column_numbers = {}, {}
+
+        numbers = {}
+        for pos in positions:
+            row_index, column_index = pos
+
+            row_number = row_numbers.get(row_index)
+            if row_number is None:
+                row_number = row_numbers[row_index] = BguSolver.count_solutions(
+                    board.rows_descriptions[row_index], board.get_row(row_index))
 
+            column_number = column_numbers.get(column_index)
+            if column_number is None:
+                column_number = column_numbers[column_index] = BguSolver.count_solutions(
+                    board.columns_descriptions[column_index], board.get_column(column_index))
+
+            numbers[pos] = row_number * column_number
+
+        return numbers
+
+    def _get_all_unsolved_jobs(self, choose_from_cells=None):
         if choose_from_cells is None:
-            # add every cell
-            choose_from_cells = product(range(board.height), range(board.width))
+            # add every unsolved cell
+            priorities = self._probing_priorities()
+        else:
+            priorities = self.board.probing_priorities(choose_from_cells)
 
-        probe_jobs = PriorityDict()
+        # heapify all the jobs at once
+        return PriorityDict(self._skip_low_rated(priorities))
 
-        for pos in choose_from_cells:
-            pos = CellPosition(*pos)
-            if board.is_cell_solved(pos):
-                continue
+    @classmethod
+    def _skip_low_rated(cls, priorities):
+        """
+        Drop the cells with all the neighbours unsolved and the low rated lines
+        (when all the cells are such, probe them all: the search needs the candidates)
+        """
+        if SKIP_LOW_RATED is None:
+            return priorities
 
-            no_unsolved = len(list(board.unsolved_neighbours(pos)))
+        # the priority is `4 - cell_rate + no_unsolved`
+        max_priority = 8 - SKIP_LOW_RATED
+        rated = {pos: priority for pos, priority in priorities.items()
+                 if priority <= max_priority}
 
-            # if no_unsolved >= 4 and skip_low_rated:
-            #     continue
+        return rated or priorities
 
-            row_rate = board.row_solution_rate(pos.row_index)
-            column_rate = board.column_solution_rate(pos.column_index)
-            cell_rate = row_rate + column_rate
+    def _probing_priorities(self):
+        """
+        The priorities of all the unsolved cells of the current board.
+        They are not changed by the queue of jobs, so can be reused.
+        """
+        board = self.board
+        if not PRIORITIES_CACHE_SIZE:
+            return board.probing_priorities()
 
-            probe_jobs[pos] = 4 - cell_rate + no_unsolved
+        fingerprint = board.fingerprint()
+        priorities = self._priorities_cache.get(fingerprint)
+        if priorities is None:
+            priorities = board.probing_priorities()
+            self._priorities_cache.save(fingerprint, priorities)
 
-        return probe_jobs
+        return priorities
 
     def _solve_without_search(self, to_the_max=False):
         """
@@ -394,9 +723,79 @@ class Solver(object):
         Based on https://www.cs.bgu.ac.il/~benr/nonograms/
         """
 
+        if self._can_probe_in_parallel():
+            self._solve_in_parallel()
+
+            # the solution is already saved by the parallel probes
+            if self.board.is_solved_full:
+                return 0, None
+
         probe_jobs = self._get_all_unsolved_jobs()
         return self._solve_jobs(probe_jobs, refill=to_the_max)
 
+    def _can_probe_in_parallel(self):
+        if PROBING_PROCESSES < 2:
+            return False
+
+        board = self.board
+        if board.width * board.height < PARALLEL_PROBING_MIN_CELLS:
+            return False
+
+        # the workers should inherit the board, not receive it pickled
+        get_start_method = getattr(multiprocessing, 'get_start_method', None)
+        if get_start_method and get_start_method() != 'fork':
+            return False
+
+        return True
+
+    def _solve_in_parallel(self):
+        """
+        Probe all the unsolved cells in several processes
+        and apply all the found contradictions at once.
+
+        The sequential probes will continue from the improved board
+        and the most of the expensive first round will be already done.
+        """
+        global _PROBING_BOARD  # pylint: disable=global-statement
+
+        board = self.board
+        positions = list(self._get_all_unsolved_jobs())
+        chunks = [positions[i::PROBING_PROCESSES] for i in range(PROBING_PROCESSES)]
+
+        _PROBING_BOARD = board
+        try:
+            with terminating_mp_pool(PROBING_PROCESSES) as pool:
+                results = pool.map(_find_contradictions, chunks)
+        finally:
+            _PROBING_BOARD = None
+
+        found = 0
+        row_indexes, column_indexes = set(), set()
+        for state in (state for chunk in results for state in chunk):
+            if state.color not in board.cell_colors(state.position):
+                continue
+
+            LOG.info('Found contradiction at (%i, %i)', *state.position)
+            try:
+                board.unset_color(state)
+            except ValueError as ex:
+                raise NonogramError(str(ex))
+
+            found += 1
+            row_indexes.add(state.row_index)
+            column_indexes.add(state.column_index)
+
+        if found:
+            LOG.warning('Found %d contradictions in %d processes',
+                        found, PROBING_PROCESSES)
+            propagation.solve(
+                board,
+                row_indexes=tuple(row_indexes),
+                column_indexes=tuple(column_indexes))
+
+            if board.is_solved_full:
+                self._add_solution()
+
     @classmethod
     def shrink_board(cls, board, candidates=()):
         """
@@ -479,6 +878,9 @@ class Solver(object):
 
                     # from now we will search the black and white board
                     self.board = single_colored
+                    self._methods = propagation.default_methods(single_colored)
+                    self._probes_cache = Cache(PROBES_CACHE_SIZE, lru=True)
+                    self._priorities_cache = Cache(PRIORITIES_CACHE_SIZE, lru=True)
                     best_candidates = self._fix_candidates_colors(best_candidates, color_mapping)
 
             self.search(best_candidates)
@@ -495,9 +897,10 @@ class Solver(object):
         board.set_finished()
         LOG.info('Full solution: %.6f sec', time.time() - start)
         for method, info in cache_info().items():
-            size, hit_rate = info
+            size, hit_rate, evictions = info
             if size > 0:
-                LOG.warning('%s cache: size=%d, hit rate=%.4f%%', method, size, hit_rate * 100.0)
+                LOG.warning('%s cache: size=%d, hit rate=%.4f%%, evicted=%d',
+                            method, size, hit_rate * 100.0, evictions)
 
     def _limits_reached(self, depth):
         """
@@ -539,20 +942,33 @@ class Solver(object):
         depth = len(path)
         full_path = path + (state,)
 
+        if self._is_dead_end(full_path):
+            LOG.warning('The path %s includes the known dead end', full_path)
+            self._add_search_result(full_path, False)
+            return False
+
         # add every cell to the jobs queue
         probe_jobs = self._get_all_unsolved_jobs()
         try:
             # update with more prioritized cells
-            for new_job, priority in self._set_guess(state):
+            for new_job, priority in self._set_guess(state).items():
                 probe_jobs[new_job] = priority
 
             if self._limits_reached(depth):
                 return True
 
-            __, best_candidates = self._solve_jobs(probe_jobs)
+            if self._can_probe_in_parallel():
+                self._solve_in_parallel()
+
+            # the guess can solve the board at once,
+            # then all the jobs are already solved cells
+            best_candidates = None
+            if not board.is_solved_full:
+                __, best_candidates = self._solve_jobs(probe_jobs)
         except NonogramError as ex:
             LOG.warning('Dead end found (%s): %s', full_path[-1], str(ex))
             self._add_search_result(full_path, False)
+            self._add_dead_end(full_path)
             return False
 
         rate = board.solution_rate
@@ -570,11 +986,61 @@ class Solver(object):
 
         return True
 
-    def _set_explored(self, path):
-        self.explored_paths.add(tuple(sorted(path)))
+    def _state_key(self, state):
+        key = self._state_keys.get(state)
+        if key is None:
+            key = self._state_keys[state] = self._random.getrandbits(64)
+        return key
 
-    def _is_explored(self, path):
-        return tuple(sorted(path)) in self.explored_paths
+    def _path_key(self, path):
+        """
+        The key of the path that does not depend on the order of its states
+        (the Zobrist hashing): the XOR of the random keys of all the states.
+        The key of the longer path is found by XOR-ing the key of the new state.
+        """
+        key = 0
+        for state in path:
+            key ^= self._state_key(state)
+        return key
+
+    def _set_explored(self, path_key):
+        self.explored_paths.add(path_key)
+
+    def _is_explored(self, path_key):
+        return path_key in self.explored_paths
+
+    def _find_dead_prefix(self, position):
+        """
+        The current search path is a dead end, because all the colors
+        of the given cell lead to the contradiction.
+
+        Check whether the same is true for the shorter prefixes of the path
+        (using the line propagation only). If so, the search levels
+        deeper than the shortest such prefix will return at once,
+        without trying their remaining states.
+        """
+        if not BACKJUMPING:
+            return
+
+        board = self.board
+        cells = board.cells
+        try:
+            # the root level is never a dead end, so start from the first guess
+            for depth in range(1, len(self._guess_checkpoints)):
+                board.restore(board.trail_snapshot(self._guess_checkpoints[depth]))
+
+                if self._all_colors_contradict(position):
+                    LOG.warning('The path is a dead end since the depth %d', depth)
+                    self._dead_depth = depth
+                    return
+        finally:
+            # the search levels will roll back the changes from the current board
+            board.restore(cells)
+
+    def _all_colors_contradict(self, position):
+        return all(
+            self.leads_to_contradiction(CellState.from_position(position, color))
+            for color in self.board.cell_colors(position))
 
     def search(self, states, path=()):
         """
@@ -583,9 +1049,31 @@ class Solver(object):
         Return False if the given path is a dead end (no solutions can be found)
         """
 
-        if self._is_explored(path):
+        path_key = self._path_key(path)
+        if self._is_explored(path_key):
             return True
 
+        # the root board is searched only once
+        if not path or not EXPLORED_STATES_CACHE_SIZE:
+            return self._search(states, path, path_key)
+
+        depth = len(path)
+        fingerprint = self.board.fingerprint()
+        explored = self._explored_states.get(fingerprint)
+        # the board searched on the shallower depth has gone
+        # at least as deep as it can go from here
+        if explored is not None and explored[0] <= depth:
+            LOG.info('The board on the path %s already explored', path)
+            return explored[1]
+
+        result = self._search(states, path, path_key)
+        if not self._limits_reached(depth):
+            self._explored_states.save(fingerprint, (depth, result))
+
+        return result
+
+    def _search(self, states, path, path_key):
+
         if self.start_time is None:
             self.start_time = time.time()
 
@@ -608,7 +1096,10 @@ class Solver(object):
 
         unconditional = False
         search_counter = 0
-        save = board.make_snapshot()
+        # do not restore the solved cells on a root path - they are really solved!
+        if path:
+            # only the cells changed on this level will be restored
+            board.start_trail()
         try:
             while search_directions:
                 total_number_of_directions = len(search_directions)
@@ -650,6 +1141,8 @@ class Solver(object):
                             "lead to the contradiction. "
                             "The path %s is invalid", assumption, pos, path)
                         # self._add_search_result(path, False)
+                        self._add_dead_end(path)
+                        self._find_dead_prefix(pos)
                         return False
 
                     # rate = board.solution_rate
@@ -663,13 +1156,14 @@ class Solver(object):
                     continue
 
                 full_path = path + (state,)
-                if self._is_explored(full_path):
+                full_path_key = path_key ^ self._state_key(state)
+                if self._is_explored(full_path_key):
                     LOG.info('The path %s already explored', full_path)
                     continue
 
                 unconditional = False
                 rate = board.solution_rate
-                guess_save = board.make_snapshot()
+                self._guess_checkpoints.append(board.start_trail())
                 try:
                     LOG.warning('Trying state (%d/%d): %s (depth=%d, rate=%.4f, previous=%s)',
                                 search_counter, total_number_of_directions,
@@ -678,11 +1172,20 @@ class Solver(object):
                     success = self._try_state(state, path)
                     # is_solved = board.is_solved_full
                 finally:
-                    board.restore(guess_save)
-                    self._set_explored(full_path)
+                    self._guess_checkpoints.pop()
+                    board.rollback()
+                    self._set_explored(full_path_key)
+
+                if self._dead_depth is not None:
+                    if depth >= self._dead_depth:
+                        LOG.warning('Backjump over the state %s (depth=%d)', state, depth)
+                        self._add_dead_end(path)
+                        return False
+
+                    # the dead end is the path just tried, handle it as usual
+                    self._dead_depth = None
 
                 if not success:
-                    # TODO: add backjumping here
                     try:
                         LOG.warning(
                             "Unset the color %s for cell '%s'. Solve it unconditionally",
@@ -697,6 +1200,8 @@ class Solver(object):
                             "lead to the contradiction. "
                             "The whole branch (depth=%d) is invalid. ", assumption, pos, depth)
                         # self._add_search_result(path, False)
+                        self._add_dead_end(path)
+                        self._find_dead_prefix(pos)
                         return False
 
                     # rate = board.solution_rate
@@ -719,7 +1224,8 @@ class Solver(object):
 
                         states_to_try.append(CellState.from_position(pos, color))
 
-                    # if all(self._is_explored(path + (state,)) for state in states_to_try):
+                    # if all(self._is_explored(path_key ^ self._state_key(state))
+                    #        for state in states_to_try):
                     #     LOG.warning('All other colors (%s) of cell %s already explored',
                     #                 states_to_try, cell)
                     #     return True
@@ -729,9 +1235,8 @@ class Solver(object):
                             search_directions.appendleft(state)
 
         finally:
-            # do not restore the solved cells on a root path - they are really solved!
             if path:
-                board.restore(save)
-                self._set_explored(path)
+                board.rollback()
+                self._set_explored(path_key)
 
         return True
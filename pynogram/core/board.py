@@ -14,10 +14,11 @@ except ImportError:
     ABC = ABCMeta(str('ABC'), (object,), {'__slots__': ()})
 
 from collections import (
+    Counter,
     defaultdict,
     namedtuple,
 )
-from copy import copy
+from itertools import chain
 
 from memoized import memoized
 from six.moves import zip, range, map
@@ -126,6 +127,12 @@ class NonogramGrid(RenderedMixin):
         self.cells = cells or self.make_cells()
         self.validate()
 
+        # the list of the changes (row_index, column_index, old_value) to roll back,
+        # the column_index is None when the whole row has changed
+        self._trail = None
+        # the positions in the trail where the nested trails have started
+        self._trail_checkpoints = []
+
         # setup the renderer after all the validations
         super(NonogramGrid, self).__init__(**renderer_params)
 
@@ -206,7 +213,13 @@ class NonogramGrid(RenderedMixin):
         :type cell_state: CellState
         """
         row_index, column_index, color = cell_state
-        self.cells[row_index][column_index] = color
+        self._set_cell(row_index, column_index, color)
+
+    def _set_cell(self, row_index, column_index, value):
+        row = self.cells[row_index]
+        if self._trail is not None:
+            self._trail.append((row_index, column_index, row[column_index]))
+        row[column_index] = value
 
     @property
     def is_colored(self):
@@ -236,6 +249,9 @@ class NonogramGrid(RenderedMixin):
     # noinspection PyUnusedLocal
     def set_row(self, index, value):
         """Set the grid's row at given index"""
+        if self._trail is not None:
+            # the row is replaced, not changed in place, so it is not copied
+            self._trail.append((index, None, self.cells[index]))
         self.cells[index] = list(value)
 
         self.row_updated(index)
@@ -243,8 +259,12 @@ class NonogramGrid(RenderedMixin):
     # noinspection PyUnusedLocal
     def set_column(self, index, value):
         """Set the grid's column at given index"""
+        trail = self._trail
         for row_index, item in enumerate(value):
-            self.cells[row_index][index] = item
+            row = self.cells[row_index]
+            if trail is not None and row[index] != item:
+                trail.append((row_index, index, row[index]))
+            row[index] = item
 
         self.column_updated(index)
 
@@ -300,6 +320,20 @@ class SolvableGrid(NonogramGrid, ABC):
         """How many cells in a vertical column are known to be box or space"""
         return self.line_solution_rate(self.get_column(index), size=self.height)
 
+    def rows_solution_rates(self):
+        """The solution rates of all the rows"""
+        size = self.width
+        return [self.line_solution_rate(row, size=size) for row in self.cells]
+
+    def columns_solution_rates(self):
+        """
+        The solution rates of all the columns.
+        The whole board is transposed at once instead of
+        collecting every column cell by cell.
+        """
+        size = self.height
+        return [self.line_solution_rate(column, size=size) for column in zip(*self.cells)]
+
     @classmethod
     def cell_solution_rate(cls, cell):
         """How much the cell's value is close to solved"""
@@ -313,6 +347,91 @@ class SolvableGrid(NonogramGrid, ABC):
         """
         raise NotImplementedError()
 
+    def unsolved_cells(self):
+        """
+        Yield the positions of all the cells
+        that are not completely solved yet.
+        """
+        for row_index, row in enumerate(self.cells):
+            for column_index in range(len(row)):
+                pos = CellPosition(row_index, column_index)
+                if not self.is_cell_solved(pos):
+                    yield pos
+
+    def unsolved_neighbours_counts(self):
+        """
+        Map every unsolved cell to the number of its unsolved neighbours.
+
+        The same as calling the `unsolved_neighbours` for every unsolved cell,
+        but the board gets scanned only once.
+        """
+        unsolved = list(self.unsolved_cells())
+
+        # the unsolved cells of every row are the bits of a number,
+        # with the empty rows above and below the board
+        masks = [0] * (self.height + 2)
+        for row_index, column_index in unsolved:
+            masks[row_index + 1] |= 1 << column_index
+
+        # for every row add up the bits of the four neighbours
+        # of all its cells at once, the sums are split into three bits
+        full_row = (1 << self.width) - 1
+        sums = {}
+        for row_index in range(self.height):
+            upper, mask, lower = masks[row_index:row_index + 3]
+            if not mask:
+                continue
+
+            left, right = (mask << 1) & full_row, mask >> 1
+            vertical, vertical_carry = upper ^ lower, upper & lower
+            horizontal, horizontal_carry = left ^ right, left & right
+
+            sums[row_index] = (
+                vertical ^ horizontal,
+                vertical_carry ^ horizontal_carry ^ (vertical & horizontal),
+                vertical_carry & horizontal_carry)
+
+        counts = {}
+        for pos in unsolved:
+            row_index, column_index = pos
+            ones, twos, fours = sums[row_index]
+            counts[pos] = (
+                (ones >> column_index & 1) +
+                (twos >> column_index & 1) * 2 +
+                (fours >> column_index & 1) * 4)
+
+        return counts
+
+    def probing_priorities(self, positions=None):
+        """
+        Map every unsolved cell (or only the given cells, if they are unsolved)
+        to the priority of probing it (the lower value goes first):
+        the more the neighbours and the lines of a cell are solved,
+        the more chances to find a contradiction.
+        """
+        counts = self.unsolved_neighbours_counts()
+        if positions is not None:
+            counts = self._only_positions(counts, positions)
+
+        # the rates of the lines are the same for all their cells,
+        # so calculate every rate only once
+        row_rates = self.rows_solution_rates()
+        column_rates = self.columns_solution_rates()
+
+        priorities = {}
+        for pos, no_unsolved in counts.items():
+            row_index, column_index = pos
+            cell_rate = row_rates[row_index] + column_rates[column_index]
+            priorities[pos] = 4 - cell_rate + no_unsolved
+
+        return priorities
+
+    @classmethod
+    def _only_positions(cls, values, positions):
+        """The items of the mapping of the cells for the given cells only"""
+        return {pos: values[pos] for pos in map(CellPosition._make, positions)
+                if pos in values}
+
     def cell_colors(self, position):
         """
         All the possible states that the cell at given position can be in.
@@ -368,8 +487,14 @@ class MultipleSolutionGrid(NonogramGrid, ABC):
         assert len(old_cells[0]) == len(new_cells[0])
 
         for i, row in enumerate(new_cells):
+            old_row = old_cells[i]
+            # the most of the rows stay the same, so compare them at once
+            # (the numpy rows are compared element-wise, so skip them)
+            if isinstance(row, list) and row == old_row:
+                continue
+
             for j, new_cell in enumerate(row):
-                old_cell = old_cells[i][j]
+                old_cell = old_row[j]
 
                 if have_deletions:
                     if new_cell != old_cell:
@@ -397,13 +522,110 @@ class MultipleSolutionGrid(NonogramGrid, ABC):
         """Safely save the current state of a board"""
         # the values of the cells just shallow copied here
         # do not do deepcopy to prevent too heavy tuple's `deepcopy`
-        return [list(row) for row in self.cells]
+        return list(map(list, self.cells))
+
+    def fingerprint(self):
+        """
+        The hash of the current state of the cells.
+        The equal states of the same board always have the same fingerprint.
+        """
+        return hash(tuple(map(tuple, self.cells)))
 
     def restore(self, snapshot):
         """Restore the previously saved state of a board"""
         self.cells = snapshot
         self.restored(snapshot)
 
+    def start_trail(self):
+        """
+        Start recording all the changes of the cells, so they can be rolled back.
+
+        It is cheaper than the full snapshot when only a few cells change.
+        The trails can be nested: every started trail should be finished
+        with its own `rollback` or `stop_trail` in the reverse order.
+
+        Return the checkpoint to get the board as it was at this moment
+        (see `trail_snapshot`).
+        """
+        if self._trail is None:
+            self._trail = []
+
+        checkpoint = len(self._trail)
+        self._trail_checkpoints.append(checkpoint)
+        return checkpoint
+
+    def _finish_trail(self, keep=False):
+        """
+        Finish the latest started trail and return its changes.
+        If `keep`, the outer trail still records them to roll back later.
+        """
+        checkpoint = self._trail_checkpoints.pop()
+        trail = self._trail
+
+        if not self._trail_checkpoints:
+            # the outermost trail records everything from the beginning
+            self._trail = None
+            return trail
+
+        changes = trail[checkpoint:]
+        if not keep:
+            del trail[checkpoint:]
+        return changes
+
+    @classmethod
+    def _undo_trail(cls, cells, trail):
+        for row_index, column_index, old_value in reversed(trail):
+            if column_index is None:
+                cells[row_index] = old_value
+            else:
+                cells[row_index][column_index] = old_value
+
+    def rollback(self):
+        """Undo all the changes recorded since the latest `start_trail`"""
+        trail = self._finish_trail()
+
+        cells = self.cells
+        self._undo_trail(cells, trail)
+        self.restored(cells)
+
+    def trail_snapshot(self, checkpoint):
+        """
+        The copy of the cells as they were at the given checkpoint
+        of the trail, the current cells stay intact.
+        """
+        # the trail is still in use: copy the replaced rows saved in it,
+        # so the earlier changes of the cells do not get into them
+        trail = [
+            (row_index, column_index,
+             list(old_value) if column_index is None else old_value)
+            for row_index, column_index, old_value in self._trail[checkpoint:]
+        ]
+
+        cells = self.make_snapshot()
+        self._undo_trail(cells, trail)
+        return cells
+
+    def stop_trail(self):
+        """
+        Stop recording the changes of the cells and keep them.
+        Return the positions of the changed cells.
+        """
+        trail = self._finish_trail(keep=True)
+
+        # the earliest recorded value of a cell is the original one
+        original = {}
+        for row_index, column_index, old_value in reversed(trail):
+            if column_index is None:
+                for column_index, old_cell in enumerate(old_value):
+                    original[row_index, column_index] = old_cell
+            else:
+                original[row_index, column_index] = old_value
+
+        cells = self.cells
+        return [(row_index, column_index)
+                for (row_index, column_index), old_value in original.items()
+                if cells[row_index][column_index] != old_value]
+
     def restored(self, snapshot):
         """
         Run each time a grid's cells restored
@@ -772,6 +994,31 @@ class BaseBoard(ReducibleGrid, ABC):
             if not self.is_cell_solved(pos):
                 yield pos
 
+    def unsolved_neighbours_count(self, position):
+        """
+        The number of the neighbour cells that are not completely solved yet
+        (the same as the length of `unsolved_neighbours`,
+        but without building the positions).
+        :type position: CellPosition
+        """
+        is_cell_solved = self.is_cell_solved
+        return sum(1 for pos in self.neighbours(position) if not is_cell_solved(pos))
+
+    def unsolved_neighbours_of(self, positions):
+        """
+        The neighbour cells of all the given cells
+        that are not completely solved yet.
+
+        The close cells share a lot of neighbours,
+        so every neighbour gets checked only once.
+        """
+        neighbours = set()
+        for position in positions:
+            neighbours.update(self.neighbours(position))
+
+        is_cell_solved = self.is_cell_solved
+        return [CellPosition(*pos) for pos in neighbours if not is_cell_solved(pos)]
+
 
 class NumpyBoard(BaseBoard, ABC):
     """
@@ -782,19 +1029,134 @@ class NumpyBoard(BaseBoard, ABC):
         super(NumpyBoard, self).__init__(columns, rows, cells=cells, **renderer_params)
         self.restore(self.cells)
 
+    def _unsolved_mask(self):
+        """The boolean matrix of the cells that are not solved yet"""
+        raise NotImplementedError()
+
+    @classmethod
+    def _positions(cls, mask):
+        """
+        The coordinates of all the cells set in the boolean matrix.
+
+        The indexes are converted to python integers with one call
+        instead of converting the numpy scalars one by one.
+        """
+        row_indexes, column_indexes = np.nonzero(mask)
+        return zip(row_indexes.tolist(), column_indexes.tolist())
+
+    def changed(self, old_cells):
+        return self._positions(self.cells != old_cells)
+
+    @classmethod
+    def _neighbours_counts(cls, unsolved):
+        """The matrix of the numbers of the unsolved neighbours for every cell"""
+
+        # sum up the four shifted copies of the mask
+        counts = np.zeros(unsolved.shape, dtype=np.uint8)
+        counts[1:] += unsolved[:-1]
+        counts[:-1] += unsolved[1:]
+        counts[:, 1:] += unsolved[:, :-1]
+        counts[:, :-1] += unsolved[:, 1:]
+        return counts
+
+    @classmethod
+    def _unsolved_values(cls, unsolved, values):
+        """Map every unsolved cell to its item of the given matrix"""
+        positions = map(CellPosition._make, cls._positions(unsolved))
+        return dict(zip(positions, values[unsolved].tolist()))
+
+    def unsolved_neighbours_counts(self):
+        unsolved = self._unsolved_mask()
+        return self._unsolved_values(unsolved, self._neighbours_counts(unsolved))
+
+    def unsolved_neighbours_of(self, positions):
+        positions = list(positions)
+        if not positions:
+            return []
+
+        given = np.zeros(self.cells.shape[:2], dtype=bool)
+        given[tuple(zip(*positions))] = True
+
+        # the four shifted copies of the mask
+        neighbours = np.zeros_like(given)
+        neighbours[1:] |= given[:-1]
+        neighbours[:-1] |= given[1:]
+        neighbours[:, 1:] |= given[:, :-1]
+        neighbours[:, :-1] |= given[:, 1:]
+
+        neighbours &= self._unsolved_mask()
+        return list(map(CellPosition._make, self._positions(neighbours)))
+
+    def probing_priorities(self, positions=None):
+        unsolved = self._unsolved_mask()
+
+        cell_rates = np.add.outer(self.rows_solution_rates(), self.columns_solution_rates())
+        priorities = 4 - cell_rates + self._neighbours_counts(unsolved)
+        priorities = self._unsolved_values(unsolved, priorities)
+        if positions is not None:
+            priorities = self._only_positions(priorities, positions)
+
+        return priorities
+
     def get_column(self, index):
         # self.cells.transpose([1, 0, 2])[index]
         return self.cells.T[index]
 
+    def columns_solution_rates(self):
+        size = self.height
+        return [self.line_solution_rate(column, size=size) for column in self.cells.T]
+
+    # the rows and the columns of the numpy matrix are changed in place,
+    # so the trail keeps the copies of the replaced lines
+
+    def set_row(self, index, value):
+        if self._trail is not None:
+            self._trail.append((index, None, self.cells[index].copy()))
+        self.cells[index] = value
+        self.row_updated(index)
+
     def set_column(self, index, value):
+        if self._trail is not None:
+            self._trail.append((None, index, self.cells[:, index].copy()))
         self.cells[:, index] = value
         self.column_updated(index)
 
     def make_snapshot(self):
-        return copy(self.cells)
+        return self.cells.copy()
+
+    def fingerprint(self):
+        # hash the python values, not the numpy scalars
+        return hash(tuple(map(tuple, self.cells.tolist())))
+
+    @classmethod
+    def _undo_trail(cls, cells, trail):
+        for row_index, column_index, old_value in reversed(trail):
+            if column_index is None:
+                cells[row_index] = old_value
+            elif row_index is None:
+                cells[:, column_index] = old_value
+            else:
+                cells[row_index, column_index] = old_value
+
+    def trail_snapshot(self, checkpoint):
+        cells = self.make_snapshot()
+        self._undo_trail(cells, self._trail[checkpoint:])
+        return cells
+
+    def stop_trail(self):
+        trail = self._finish_trail(keep=True)
+        if not trail:
+            return []
+
+        original = self.make_snapshot()
+        self._undo_trail(original, trail)
+        return list(self.changed(original))
 
     def restore(self, snapshot):
-        self.cells = np.array(snapshot)
+        # the snapshot is not copied again (as the lists are not copied
+        # in the base implementation): it belongs to the board from now
+        self.cells = np.asarray(snapshot)
+        self.restored(snapshot)
 
     def _current_state_in_solutions(self):
         for solution in self.solutions:
@@ -842,10 +1204,33 @@ class BlackBoard(BaseBoard):
         cell = self.cells[i][j]
         return cell != UNKNOWN
 
+    def unsolved_cells(self):
+        for row_index, row in enumerate(self.cells):
+            # skip the solved rows at once
+            if UNKNOWN not in row:
+                continue
+
+            for column_index, cell in enumerate(row):
+                if cell == UNKNOWN:
+                    yield CellPosition(row_index, column_index)
+
     @classmethod
     def colors(cls):
         return {BOX, SPACE}
 
+    # the possible states depend only on the value of a cell,
+    # so do not build a new set on every probe.
+    # ATTENTION: the sets are shared, so do not change them
+    _CELL_COLORS = {
+        UNKNOWN: frozenset((BOX, SPACE)),
+        BOX: frozenset((BOX,)),
+        SPACE: frozenset((SPACE,)),
+    }
+
+    def cell_colors(self, position):
+        i, j = position
+        return self._CELL_COLORS[self.cells[i][j]]
+
     @property
     def is_colored(self):
         return False
@@ -854,24 +1239,41 @@ class BlackBoard(BaseBoard):
         row_index, column_index, bad_state = cell_state
         if self.cells[row_index][column_index] != UNKNOWN:
             raise ValueError('Cannot unset already set cell %s' % ([row_index, column_index]))
-        self.cells[row_index][column_index] = invert(bad_state)
+        self._set_cell(row_index, column_index, invert(bad_state))
 
     @property
     def is_solved_full(self):
+        # check the whole rows at C speed
         for row in self.cells:
-            for cell in row:
-                if cell == UNKNOWN:
-                    return False
+            if UNKNOWN in row:
+                return False
         return True
 
+    @property
+    def solution_rate(self):
+        # count the unsolved cells of the whole board at once
+        # to not sum up the rounded rates of the rows
+        size = self.width * self.height
+        unsolved = sum(row.count(UNKNOWN) for row in self.cells)
+        return (size - unsolved) / size
+
     @classmethod
     def line_solution_rate(cls, row, size=None):
         """How many cells in a given line are known to be box or space"""
 
+        if not isinstance(row, (list, tuple)):
+            # the columns come as generators
+            if size is None:
+                row = tuple(row)
+                size = len(row)
+
+            return sum(1 for cell in row if cell != UNKNOWN) / size
+
         if size is None:
             size = len(row)
 
-        return sum(1 for cell in row if cell != UNKNOWN) / size
+        # count the unknown cells at C speed
+        return (len(row) - row.count(UNKNOWN)) / size
 
     @classmethod
     def cell_solution_rate(cls, cell):
@@ -1121,24 +1523,20 @@ class ColorBoard(BaseBoard, ReduceColorToBlackMixin):
 
     def unset_color(self, cell_state):
         row_index, column_index, bad_state = cell_state
-        colors = set(self.cell_colors(cell_state.position))
-
-        bad_state = self.cell_as_color_set(bad_state)
-
-        LOG.debug('(%d, %d) previous state: %s',
-                  row_index, column_index, colors)
-        LOG.debug('Bad states: %s', bad_state)
+        cell = self.cells[row_index][column_index]
 
-        new_value = colors - bad_state
+        # the colors are the bits of the cell value,
+        # so drop them without building the sets
+        new_value = cell & ~bad_state
 
-        if set() < new_value < colors:
-            LOG.debug('(%d, %d) new state: %s',
-                      row_index, column_index, new_value)
-            new_value = from_two_powers(new_value)
-            self.cells[row_index][column_index] = new_value
+        if new_value and new_value != cell:
+            LOG.debug('(%d, %d) new state: %s -> %s',
+                      row_index, column_index, cell, new_value)
+            self._set_cell(row_index, column_index, new_value)
         else:
             raise ValueError("Cannot unset the colors {!r} from cell {} ({})".format(
-                bad_state, (row_index, column_index), colors))
+                self.cell_as_color_set(bad_state), (row_index, column_index),
+                self.cell_as_color_set(cell)))
 
     @property
     def is_colored(self):
@@ -1146,14 +1544,22 @@ class ColorBoard(BaseBoard, ReduceColorToBlackMixin):
 
     @property
     def is_solved_full(self):
-        cell_solution_rate_func = self.cell_solution_rate
+        # every solved cell has exactly one of the colors
+        colors = self.colors()
 
         for row in self.cells:
-            for cell in row:
-                if cell_solution_rate_func(cell) != 1:
-                    return False
+            if not colors.issuperset(row):
+                return False
         return True
 
+    @property
+    def solution_rate(self):
+        # the board has only a few distinct values of the cells,
+        # so rate every value once, not every cell of every row
+        counts = Counter(chain.from_iterable(self.cells))
+        solved = sum(self.cell_solution_rate(cell) * number for cell, number in counts.items())
+        return solved / (self.width * self.height)
+
     def line_solution_rate(self, row, size=None):
         """
         How many cells in a row are known to be of particular color
@@ -1162,9 +1568,7 @@ class ColorBoard(BaseBoard, ReduceColorToBlackMixin):
         if size is None:
             size = len(row)
 
-        cell_solution_rate_func = self.cell_solution_rate
-
-        solved = sum(cell_solution_rate_func(cell) for cell in row)
+        solved = sum(map(self.cell_solution_rate, row))
         return solved / size
 
     def cell_solution_rate(self, cell):
@@ -1185,6 +1589,17 @@ class ColorBoard(BaseBoard, ReduceColorToBlackMixin):
         cell = self.cells[i][j]
         return cell in self.colors()
 
+    def unsolved_cells(self):
+        colors = self.colors()
+        for row_index, row in enumerate(self.cells):
+            # skip the solved rows at once
+            if colors.issuperset(row):
+                continue
+
+            for column_index, cell in enumerate(row):
+                if cell not in colors:
+                    yield CellPosition(row_index, column_index)
+
     def cell_colors(self, position):
         i, j = position
         cell = self.cells[i][j]
@@ -1383,10 +1798,80 @@ def _color_cell_solution_rate(cell, all_colors):
 class NumpyBlackBoard(BlackBoard, NumpyBoard):
     """Black-and-white board that uses numpy matrix to store the cells"""
 
+    # all the whole-board checks are done with the vectorized operations
+    # instead of iterating over the numpy scalars one by one
+
+    @property
+    def solution_rate(self):
+        return np.count_nonzero(self.cells != UNKNOWN) / self.cells.size
+
+    @property
+    def is_solved_full(self):
+        return not (self.cells == UNKNOWN).any()
+
+    @classmethod
+    def line_solution_rate(cls, row, size=None):
+        row = np.asarray(row)
+        if size is None:
+            size = len(row)
+
+        return np.count_nonzero(row != UNKNOWN) / size
+
+    def rows_solution_rates(self):
+        solved = np.count_nonzero(self.cells != UNKNOWN, axis=1)
+        return (solved / self.width).tolist()
+
+    def columns_solution_rates(self):
+        solved = np.count_nonzero(self.cells != UNKNOWN, axis=0)
+        return (solved / self.height).tolist()
+
+    def _unsolved_mask(self):
+        return self.cells == UNKNOWN
+
+    def unsolved_cells(self):
+        return map(CellPosition._make, self._positions(self._unsolved_mask()))
+
 
 class NumpyColorBoard(ColorBoard, NumpyBoard):
     """Colored board that uses numpy matrix to store the cells"""
 
+    def _solved_cells(self):
+        return np.isin(self.cells, list(self.colors()))
+
+    def _cells_rates(self):
+        """The matrix of the solution rates of the cells (every value is rated once)"""
+        values, inverse = np.unique(self.cells, return_inverse=True)
+        rates = np.array([self.cell_solution_rate(value) for value in values.tolist()])
+        return rates[inverse].reshape(self.cells.shape)
+
+    @property
+    def solution_rate(self):
+        values, counts = np.unique(self.cells, return_counts=True)
+        solved = sum(self.cell_solution_rate(value) * number
+                     for value, number in zip(values.tolist(), counts.tolist()))
+        return solved / self.cells.size
+
+    # sum up the rates one by one (not pairwise as `np.sum` does),
+    # to get exactly the same rates as the generic implementation
+
+    def rows_solution_rates(self):
+        solved = np.cumsum(self._cells_rates(), axis=1)[:, -1]
+        return (solved / self.width).tolist()
+
+    def columns_solution_rates(self):
+        solved = np.cumsum(self._cells_rates(), axis=0)[-1]
+        return (solved / self.height).tolist()
+
+    @property
+    def is_solved_full(self):
+        return bool(self._solved_cells().all())
+
+    def _unsolved_mask(self):
+        return ~self._solved_cells()
+
+    def unsolved_cells(self):
+        return map(CellPosition._make, self._positions(self._unsolved_mask()))
+
 
 class BlottedBoardMixin(BaseBoard, ABC):
     """Common operations for boards with blotted clues"""
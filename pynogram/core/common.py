@@ -55,6 +55,14 @@ SPACE = False  # BlackAndWhite.WHITE
 # for colored puzzles only integer is allowed
 SPACE_COLORED = Color.white().id_
 
+# the cell value for every pair of the bits (can be space, can be box)
+# taken from the binary representations of the painted cells masks
+PAINTED_CELLS = {
+    ('1', '0'): SPACE,
+    ('0', '1'): BOX,
+    ('1', '1'): UNKNOWN,
+}
+
 
 def invert(cell_state):
     """
@@ -6,7 +6,7 @@ from __future__ import unicode_literals, print_function
 import logging
 
 from six import (
-    iteritems, itervalues,
+    iteritems,
     add_metaclass,
 )
 
@@ -15,11 +15,22 @@ from pynogram.core.common import (
     SPACE_COLORED,
     BlottedBlock,
 )
-from pynogram.utils.cache import Cache
-from pynogram.utils.other import two_powers
+from pynogram.utils.cache import (
+    Cache,
+    PersistentCache,
+    move_to_end,
+)
+from pynogram.utils.other import is_power_of_two
 
 LOG = logging.getLogger(__name__)
 
+# the cached value for the lines that the solver cannot improve
+UNCHANGED = True
+
+# the maximum number of line solutions to keep for every solver
+# (the least recently used clues are evicted when it is reached)
+LINE_CACHE_SIZE = 2 ** 16
+
 
 class TwoLayerCache(Cache):
     """
@@ -27,15 +38,33 @@ class TwoLayerCache(Cache):
     The keys are pairs (clue, partial_solution)
     """
 
+    def __init__(self, *args, **kwargs):
+        super(TwoLayerCache, self).__init__(*args, **kwargs)
+        # the size is checked on every save, so do not count it every time
+        self._size = 0
+
     def __len__(self):
-        return sum(len(lines) for lines in itervalues(self._storage))
+        return self._size
+
+    def _clear(self):
+        super(TwoLayerCache, self)._clear()
+        self._size = 0
+
+    def _evict(self):
+        """Drop all the solutions for the least recently used clue"""
+        __, clue_solutions = self._storage.popitem(last=False)
+        self._size -= len(clue_solutions)
+        self.evictions += len(clue_solutions)
 
     def _save(self, name, value, **kwargs):
         clue, prev_line = name
-        if clue not in self._storage:
-            self._storage[clue] = dict()
+        clue_solutions = self._storage.get(clue)
+        if clue_solutions is None:
+            self._storage[clue] = clue_solutions = dict()
 
-        self._storage[clue][prev_line] = value
+        if prev_line not in clue_solutions:
+            self._size += 1
+        clue_solutions[prev_line] = value
 
     def _get(self, name):
         clue, prev_line = name
@@ -43,15 +72,18 @@ class TwoLayerCache(Cache):
         if clue_solutions is None:
             return None
 
+        if self.lru:
+            move_to_end(self._storage, clue)
         return clue_solutions.get(prev_line)
 
     def delete(self, name):
         clue, prev_line = name
         clue_solutions = self._storage.get(clue)
-        if clue_solutions is None:
+        if clue_solutions is None or prev_line not in clue_solutions:
             return False
 
-        return bool(clue_solutions.pop(prev_line, False))
+        self._size -= 1
+        return bool(clue_solutions.pop(prev_line))
 
 
 class LineSolutionsMeta(type):
@@ -61,18 +93,31 @@ class LineSolutionsMeta(type):
     """
 
     registered_caches = {}
+    registered_solvers = {}
 
     def __new__(mcs, *args, **kwargs):
         new_cls = super(LineSolutionsMeta, mcs).__new__(mcs, *args, **kwargs)
-        new_cls.solutions_cache = Cache(increase=True)
+        new_cls.solutions_cache = TwoLayerCache(max_size=LINE_CACHE_SIZE, lru=True)
         mcs.registered_caches[new_cls.__name__] = new_cls.solutions_cache
+        mcs.registered_solvers[new_cls.__name__] = new_cls
         return new_cls
 
 
+def persist_caches(path):
+    """
+    Store the solutions of all the solvers in the database at given path,
+    so the lines solved once are not solved again on the next runs
+    """
+    for class_name, solver_cls in iteritems(LineSolutionsMeta.registered_solvers):
+        cache = PersistentCache(path, class_name, increase=True)
+        solver_cls.solutions_cache = cache
+        LineSolutionsMeta.registered_caches[class_name] = cache
+
+
 def cache_info():
-    """Cache size and hit rate for different solvers"""
+    """Cache size, hit rate and number of evicted items for different solvers"""
     return {
-        class_name: (len(cache), cache.hit_rate)
+        class_name: (len(cache), cache.hit_rate, cache.evictions)
         for class_name, cache in iteritems(LineSolutionsMeta.registered_caches)
     }
 
@@ -84,6 +129,8 @@ class BaseLineSolver(object):
     facilities to save and extract solutions using cache
     """
 
+    __slots__ = ['description', 'line']
+
     def __init__(self, description, line):
         self.description = description
         self.line = line
@@ -109,6 +156,9 @@ class BaseLineSolver(object):
             raise NonogramError(
                 cls._error_message(description, line, additional_info=' (cached)'))
 
+        if solved is UNCHANGED:
+            return line
+
         if solved is not None:
             assert len(solved) == len(line)
             return solved
@@ -122,6 +172,12 @@ class BaseLineSolver(object):
                 cls._error_message(description, line, additional_info=': {}'.format(ex)))
 
         assert len(solved) == len(line)
+        if solved == line:
+            # return the very same object, so the caller
+            # can detect the absence of changes by identity
+            cls.save_in_cache((description, line), UNCHANGED)
+            return line
+
         cls.save_in_cache((description, line), solved)
         return solved
 
@@ -129,7 +185,8 @@ class BaseLineSolver(object):
     def save_in_cache(cls, original, solved):
         """
         Put the solution in local cache.
-        Use solved=False to show that the line is not solvable.
+        Use solved=False to show that the line is not solvable
+        and solved=UNCHANGED to show that the line cannot be solved any further.
         """
         cls.solutions_cache.save(original, solved)
 
@@ -192,13 +249,10 @@ class TrimmedSolver(BaseLineSolver):
                 pos += 1
                 continue
 
-            cell = line[pos]
-            cell_colors = two_powers(cell)
-            if len(cell_colors) > 1:
+            color = line[pos]
+            if not is_power_of_two(color):
                 break
 
-            color = cell_colors[0]
-
             if block_index > last_block:
                 raise NonogramError(
                     'Bad block index {} '
@@ -220,9 +274,8 @@ class TrimmedSolver(BaseLineSolver):
                     end_pos += 1
 
                 if end_pos <= last_pos:
-                    cell_colors = two_powers(line[end_pos])
                     # can't say definitely whether the blotted block ends here
-                    if color in cell_colors:
+                    if line[end_pos] & color:
                         # the partially solved blotted block can be reduced to one cell
                         pos = end_pos - 1
                         break
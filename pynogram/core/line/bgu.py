@@ -11,13 +11,14 @@ from __future__ import unicode_literals
 import logging
 from collections import defaultdict
 from functools import reduce
-from itertools import product
+from itertools import groupby, product
 
 from six.moves import range, zip
 
 from pynogram.core.color import ColorBlock
 from pynogram.core.common import (
     UNKNOWN, BOX, SPACE, SPACE_COLORED,
+    PAINTED_CELLS,
     BlottedBlock,
     partial_sums,
     slack_space,
@@ -27,193 +28,335 @@ from pynogram.core.line.base import (
     TrimmedSolver,
     NonogramError,
 )
+from pynogram.utils.cache import lru_cache
 from pynogram.utils.iter import (
     expand_generator,
     max_continuous_interval,
 )
 from pynogram.utils.other import (
     two_powers, from_two_powers,
+    is_power_of_two,
 )
 
 LOG = logging.getLogger(__name__)
 
-# dummy constant
-BOTH_COLORS = -1
+# the states of the solved subproblem
+NOT_SOLVABLE, SOLVABLE = 1, 2
 
 
-class BguSolver(BaseLineSolver):
+@lru_cache(maxsize=4096)
+def block_sums(blocks, colored):
     """
-    The solver uses recursion to solve the line to the most
+    The minimum indexes of the last cells for every prefix of the blocks
+    (prepended with the zero for the empty prefix).
+
+    The same descriptions are solved over and over again,
+    so the immutable result is cached.
     """
+    min_indexes = [s - 1 for s in partial_sums(blocks, colored=colored)]
+    return (0,) + tuple(min_indexes)
 
-    def __init__(self, description, line):
-        super(BguSolver, self).__init__(description, line)
-        self._additional_space = self._set_additional_space()
 
-        self.block_sums = self.calc_block_sum(description)
-        self.solved_line = list(self.line)
+def _reverse_bits(mask, size):
+    """The bitmask of the line read from the end"""
+    return int('{:0{}b}'.format(mask, size)[::-1], 2)
 
-        self._reset_solutions_table()
 
-    def _reset_solutions_table(self):
-        positions = len(self.line)
-        job_size = len(self.description) + 1
-        self.sol = [[None] * positions for _ in range(job_size)]
+def _fill_runs(mask, size, runs_cache):
+    """
+    The bitmask of the cells starting `size` consecutive cells
+    all set in the given mask (cached for every size).
+    """
+    runs = runs_cache.get(size)
+    if runs is None:
+        runs, length = mask, 1
+        while length < size:
+            step = min(length, size - length)
+            runs &= runs >> step
+            length += step
+        runs_cache[size] = runs
+    return runs
+
+
+def _prefix_states(sizes, can_be_space, can_be_box, start):
+    """
+    For every prefix of the blocks find all the positions q
+    such that the line[:q] ending with a space can hold that blocks.
+    The k-th bit of the result is set for the position k
+    (the zero position is the empty line).
+
+    All the positions are calculated at once with the bitwise operations:
+    the line[:q] ending with a space can be extended with the next space
+    while the cells can be spaces (the run of the ones in the bitmask),
+    so the carry of the addition spreads the position over the whole run.
+    """
+    passable = can_be_space << 1
+    runs_cache = {}
 
-    def _set_additional_space(self):
-        """
-        Define the internal representation of a line to be one cell larger then the original.
-        This is done to avoid an edge case later in our recursive formula.
-        """
-        if self.line[-1] != SPACE:
-            self.line = list(self.line) + [SPACE]
-            return True
+    states = []
+    positions = start
+    for block in range(len(sizes) + 1):
+        if block:
+            size = sizes[block - 1]
+            # the block starts right after the previous prefix
+            # and is followed by a space
+            starts = states[-1] & _fill_runs(can_be_box, size, runs_cache) & (can_be_space >> size)
+            positions = starts << (size + 1)
 
-        return False
+        first = (positions << 1) & passable
+        states.append(positions | ((((passable + first) ^ passable) | first) & passable))
 
-    def _solve(self):
-        if self.try_solve():
-            solved = self.solved_line
-            if self._additional_space:
-                solved = solved[:-1]
-            solved = (UNKNOWN if cell == BOTH_COLORS else cell for cell in solved)
-            return solved
+    return states
 
-        raise NonogramError('Bad line')
 
-    def try_solve(self):
-        """
-        The main solver function.
-        Return whether the line is solvable.
-        """
-        position, block = len(self.line) - 1, len(self.description)
-        return self.get_sol(position, block)
+# The following function is the core of the black-and-white solver.
+# It intentionally deals only with the plain integers,
+# so every step works on all the cells of the line at once.
 
-    @classmethod
-    def calc_block_sum(cls, blocks):
-        """
-        calculates the partial sum of the blocks.
-        this is used later to determine if we can fit some blocks in the space left on the line
-        """
-        min_indexes = [s - 1 for s in partial_sums(blocks, colored=False)]
-        return [0] + min_indexes
+def solve_blocks(sizes, space_mask, box_mask, line_size):
+    """
+    Find all the valid placements of the blocks of given `sizes` in the line
+    and merge them into two bitmasks: the k-th bit is set
+    if the k-th cell can be a space (a box).
+    The last cell of the line should be a space.
+    Return None if the blocks cannot be placed at all.
+
+    The positions the prefixes of the blocks can end at are found
+    for the line and (in the same way) for the reversed line.
+    The cell can be a space if both the prefix of the line before it
+    and the suffix after it can hold their blocks.
+    The block can be placed if the prefix before it can hold
+    the previous blocks and the suffix after it can hold the next ones.
+
+    :param sizes: the blocks of the description
+    :param space_mask: the bitmask of the known spaces
+    :param box_mask: the bitmask of the known boxes
+    :param line_size: the number of cells in the line
+    """
+    blocks_number = len(sizes)
+
+    full_mask = (1 << line_size) - 1
+    can_be_space = full_mask & ~box_mask
+    can_be_box = full_mask & ~space_mask
+
+    prefixes = _prefix_states(sizes, can_be_space, can_be_box, 1)
+    if not (prefixes[blocks_number] >> line_size) & 1:
+        return None
+
+    # the reversed line starts with its last cell being a space
+    reversed_space = _reverse_bits(can_be_space, line_size)
+    suffixes = _prefix_states(
+        sizes[::-1], reversed_space, _reverse_bits(can_be_box, line_size),
+        (reversed_space & 1) << 1)
+
+    runs_cache = {}
+    spaces = boxes = 0
+    for block in range(blocks_number + 1):
+        # the positions q such that the line[q-1:] starting with a space
+        # can hold the blocks[block:]
+        suffix = _reverse_bits(suffixes[blocks_number - block], line_size + 1) << 1
+        spaces |= prefixes[block] & suffix
+
+        if block:
+            size = sizes[block - 1]
+            starts = prefixes[block - 1] & _fill_runs(can_be_box, size, runs_cache)
+            starts &= suffix >> (size + 1)
+
+            # paint every cell of the block from all the starts
+            length = 1
+            while length < size:
+                step = min(length, size - length)
+                starts |= starts << step
+                length += step
+            boxes |= starts
+
+    # the position q ends with the space at the cell q-1
+    return spaces >> 1, boxes
+
+
+def count_placements(sizes, space_mask, box_mask, line_size):
+    """
+    Count all the valid placements of the blocks of given `sizes` in the line
+    (the arguments are the same as for the `solve_blocks`).
 
-    def fill_matrix_top_down(self, position, block):
-        """
-        Calculate the solution for line[:position+1]
-        in respect to description[:block]
+    The table of subproblems is similar: the value for (position, block)
+    is the number of ways the line[:position] can hold the first `block`
+    blocks, so that the cell `position` is free to be a space.
+    Only two rows of the table are kept at a time.
+    """
+    # whether the cell can be a space and
+    # the number of cells before it that can be boxes
+    can_be_space = bytearray(line_size)
+    boxes_runs = [0] * (line_size + 1)
+    boxes_run = 0
+    for position in range(line_size):
+        boxes_runs[position] = boxes_run
+        if (box_mask >> position) & 1:
+            boxes_run += 1
+        else:
+            can_be_space[position] = 1
+            if (space_mask >> position) & 1:
+                boxes_run = 0
+            else:
+                boxes_run += 1
+    # the virtual space after the line
+    boxes_runs[line_size] = boxes_run
 
-        :param position: position of cell we're currently trying to fill
-        :param block: current block number
-        :return: whether the segment of line solvable
-        """
+    # no blocks: only the spaces in the whole prefix
+    counts = [0] * (line_size + 1)
+    counts[0] = 1
+    for position in range(line_size):
+        if not can_be_space[position]:
+            break
+        counts[position + 1] = 1
 
-        if (position < 0) or (block < 0):
-            return None
+    for size in sizes:
+        prev_counts = counts
+        counts = [0] * (line_size + 1)
 
-        # too many blocks left to fit this line segment
-        if position < self.block_sums[block]:
-            return False
+        # the block occupies the line[position - size:position]
+        # and the cell `position` is a space (or the end of the line)
+        for position in range(size, line_size + 1):
+            ways = 0
+            if position > 0 and can_be_space[position - 1]:
+                ways = counts[position - 1]
 
-        # recursive case
-        if self.line[position] == BOX:  # current cell is BOX
-            return False  # can't place a block if the cell is black
+            if boxes_runs[position] >= size:
+                start = position - size
+                if start == 0:
+                    ways += prev_counts[0]
+                elif can_be_space[start - 1]:
+                    ways += prev_counts[start - 1]
 
-        # base case
-        if position == 0:  # reached the end of the line
-            if block == 0:
-                self.add_cell_color(position, SPACE)
-                return True
+            counts[position] = ways
 
-            return False
+    return counts[line_size]
 
-        # current cell is either white or unknown
-        white_ans = self.get_sol(position - 1, block)
 
-        # block == 0 means we finished filling all the blocks (can still fill whitespace)
-        if block > 0:
-            block_size = self.description[block - 1]
+class BguSolver(BaseLineSolver):
+    """
+    The solver uses dynamic programming to solve the line to the most
+    """
 
-            if self.can_place_block(position - block_size, block_size):
-                black_ans = self.get_sol(position - block_size - 1, block - 1)
-                if black_ans:
-                    # set cell white, place the current block and continue
-                    self.set_line_block(position - block_size, position)
-                    return True
+    # the solver is created for every line to solve,
+    # so do not allocate the __dict__ for every instance
+    __slots__ = ['_additional_space', 'space_mask', 'box_mask', 'block_sums', 'solved_line']
 
-        if white_ans:
-            # set cell white and continue
-            self.add_cell_color(position, SPACE)
+    def __init__(self, description, line):
+        super(BguSolver, self).__init__(description, line)
+        self._additional_space = self._set_additional_space()
+        self.space_mask, self.box_mask = self._line_masks()
+
+        self.block_sums = self.calc_block_sum(description)
+        self.solved_line = None
+
+    def _set_additional_space(self):
+        """
+        Define the internal representation of a line to be one cell larger then the original.
+        This is done to avoid an edge case later in our formula.
+        """
+        if self.line[-1] != SPACE:
+            self.line = list(self.line) + [SPACE]
             return True
 
-        return False  # no solution
+        return False
 
-    def can_place_block(self, position, length):
+    def _line_masks(self):
         """
-        check if we can place a block of a specific length in this position
-        we check that our partial solution does not negate the line's partial solution
-        :param position:  position to place block at
-        :param length:  length of block
+        Represent the known cells of the line as two integer bitmasks:
+        the k-th bit is set if the k-th cell is a space (a box)
         """
-        if position < 0:
-            return False
+        space_mask = box_mask = 0
+        for k, cell in enumerate(self.line):
+            if cell == SPACE:
+                space_mask |= 1 << k
+            elif cell == BOX:
+                box_mask |= 1 << k
 
-        # if no negations were found, the block can be placed
-        return SPACE not in self.line[position: position + length]
+        return space_mask, box_mask
 
-    def add_cell_color(self, position, value):
-        """sets a cell in the solution matrix"""
+    def _solve(self):
+        solved = self._solve_trivial()
+        if solved is None:
+            if not self.try_solve():
+                raise NonogramError('Bad line')
+            solved = self.solved_line
 
-        cell = self.solved_line[position]
-        if cell == BOTH_COLORS:
-            pass
-        elif cell == UNKNOWN:
-            self.solved_line[position] = value
-        elif cell != value:
-            self.solved_line[position] = BOTH_COLORS
+        if self._additional_space:
+            solved = solved[:-1]
+        return solved
 
-    def set_line_block(self, start_pos, end_pos):
+    def _solve_trivial(self):
         """
-        sets a block in the solution matrix. all cells are painted black,
-        except the end_pos which is white.
-        :param start_pos: position to start painting
-        :param end_pos: position to stop painting
+        Solve the line without the DP if it has no unknown cells
+        or the description is empty.
+
+        Return None if the line is neither of those.
         """
+        line = self.line
+        # the empty line can be described as (0,)
+        description = tuple(size for size in self.description if size)
+
+        if UNKNOWN not in line:
+            blocks = tuple(len(tuple(group)) for cell, group in groupby(line) if cell == BOX)
+            if blocks != description:
+                raise NonogramError('The solved line has blocks %r' % (blocks,))
+            return line
 
-        # set blacks
-        for i in range(start_pos, end_pos):
-            self.add_cell_color(i, BOX)
+        if not description:
+            if self.box_mask:
+                raise NonogramError('The line has boxes but the description is empty')
+            return [SPACE] * len(line)
 
-        self.add_cell_color(end_pos, SPACE)
+        return None
 
-    def set_sol(self, position, block, value):
-        """
-        sets a value in the solution matrix
-        so we wont calculate this value recursively anymore
-        """
-        if position < 0:
-            return
+    def _paint(self, spaces, boxes):
+        """Convert the painted cells masks into the solved line"""
+        size = len(self.line)
 
-        self.sol[block][position] = value
+        # the binary representation of the masks with the first cell going first
+        # (the additional high bit preserves the leading zeros)
+        spaces_bits = bin(spaces | (1 << size))[:2:-1]
+        boxes_bits = bin(boxes | (1 << size))[:2:-1]
 
-    def get_sol(self, position, block):
+        self.solved_line = [PAINTED_CELLS[bits] for bits in zip(spaces_bits, boxes_bits)]
+
+    def try_solve(self):
         """
-        gets the value from the solution matrix
-        if the value is missing, we calculate it recursively
+        The main solver function.
+        Return whether the line is solvable.
         """
+        painted = solve_blocks(
+            self.description, self.space_mask, self.box_mask, len(self.line))
 
-        if position == -1:
-            # finished placing the last block, exactly at the beginning of the line.
-            return block == 0
+        if painted is None:
+            return False
 
-        can_be_solved = self.sol[block][position]  # self._get_sol(position, block)
-        if can_be_solved is None:
-            can_be_solved = self.fill_matrix_top_down(position, block)
+        self._paint(*painted)
+        return True
 
-            # self.set_sol(position, block, can_be_solved)
-            self.sol[block][position] = can_be_solved
+    @classmethod
+    def calc_block_sum(cls, blocks):
+        """
+        calculates the partial sum of the blocks.
+        this is used later to determine if we can fit some blocks in the space left on the line
+        """
+        return block_sums(tuple(blocks), False)
+
+    @classmethod
+    def count_solutions(cls, description, line):
+        """
+        The number of ways the line can be solved
+        (every way is a complete line that matches the description).
+        """
+        # the row of the numpy board has no truth value
+        line = tuple(line)
+        if not line:
+            return 1
 
-        return can_be_solved
+        solver = cls(tuple(size for size in description if size), line)
+        return count_placements(
+            solver.description, solver.space_mask, solver.box_mask, len(solver.line))
 
 
 UNKNOWN_COLORED = 0
@@ -224,14 +367,62 @@ class BguColoredSolver(BguSolver):
     The BGU solver for colored puzzles
     """
 
+    __slots__ = ['_blocks', '_color_masks', 'sol']
+
     def __init__(self, description, line):
         super(BguColoredSolver, self).__init__(description, line)
         self.solved_line = [UNKNOWN_COLORED] * len(self.line)
+        self._blocks = self._blocks_layout()
+        self._color_masks = self._colors_masks()
+        self._reset_solutions_table()
+
+    def _colors_masks(self):
+        """
+        For every color of the description (and the space) build a bitmask
+        where the k-th bit is set if the k-th cell can have that color
+        """
+        colors = set(color for size, color in self.description)
+        colors.add(SPACE_COLORED)
+
+        masks = dict.fromkeys(colors, 0)
+        for k, cell in enumerate(self.line):
+            for color in colors:
+                if cell & color:
+                    masks[color] |= 1 << k
+
+        return masks
+
+    def _blocks_layout(self):
+        """
+        For every block find its color, whether it should be trailed with a space
+        and the number of cells it occupies (including that space)
+        """
+        layout = []
+        for index, (size, color) in enumerate(self.description, 1):
+            trailing_space = self._trail_with_space(index)
+            if trailing_space:
+                size += 1
+            layout.append((size, color, trailing_space))
+
+        return tuple(layout)
+
+    def _reset_solutions_table(self):
+        """
+        The table of the solved subproblems (a byte per block and position):
+        0 means not solved yet, otherwise one of SOLVABLE or NOT_SOLVABLE
+        """
+        positions = len(self.line)
+        job_size = len(self.description) + 1
+        self.sol = [bytearray(positions) for _ in range(job_size)]
 
     def _set_additional_space(self):
         """Additional space is useless in colored"""
         return False
 
+    def _line_masks(self):
+        """The colored cells are checked with the colors bits directly"""
+        return 0, 0
+
     def _solve(self):
         if self.try_solve():
             solved = self.solved_line  # [:-1]
@@ -239,10 +430,13 @@ class BguColoredSolver(BguSolver):
 
         raise NonogramError('Bad line')
 
+    def try_solve(self):
+        position, block = len(self.line) - 1, len(self.description)
+        return self.get_sol(position, block)
+
     @classmethod
     def calc_block_sum(cls, blocks):
-        min_indexes = [s - 1 for s in partial_sums(blocks, colored=True)]
-        return [0] + min_indexes
+        return block_sums(tuple(blocks), True)
 
     def _precede_with_space(self, j):
         current_color = self.description[j].color
@@ -265,6 +459,15 @@ class BguColoredSolver(BguSolver):
         return False
 
     def fill_matrix_top_down(self, position, block):
+        """
+        Calculate the solution for line[:position+1]
+        in respect to description[:block]
+
+        :param position: position of cell we're currently trying to fill
+        :param block: current block number
+        :return: whether the segment of line solvable
+        """
+
         if (position < 0) or (block < 0):
             return None
 
@@ -283,29 +486,29 @@ class BguColoredSolver(BguSolver):
 
             return False
 
+        get_sol = self.get_sol
+
         white_ans = False
-        if self.can_be_space(position):
+        if self.line[position] & SPACE_COLORED:
             # current cell is either white or unknown
-            white_ans = self.get_sol(position - 1, block)
+            white_ans = get_sol(position - 1, block)
             if white_ans:
                 # set cell white and continue
-                self.add_cell_color(position, SPACE_COLORED)
+                self.solved_line[position] |= SPACE_COLORED
 
         color_ans = False
         # block == 0 means we finished filling all the blocks (can still fill whitespace)
         if block > 0:
-            block_size, current_color = self.description[block - 1]
-            trailing_space = self._trail_with_space(block)
-            if trailing_space:
-                block_size += 1
+            block_size, current_color, trailing_space = self._blocks[block - 1]
+            start = position - block_size + 1
 
             # (position-block_size, position]
-            if self.can_place_color(position - block_size + 1, position,
+            if self.can_place_color(start, position,
                                     current_color, trailing_space=trailing_space):
-                color_ans = self.get_sol(position - block_size, block - 1)
+                color_ans = get_sol(start - 1, block - 1)
                 if color_ans:
                     # set cell white, place the current block and continue
-                    self.set_color_block(position - block_size + 1, position,
+                    self.set_color_block(start, position,
                                          current_color, trailing_space=trailing_space)
 
         return color_ans or white_ans
@@ -333,12 +536,44 @@ class BguColoredSolver(BguSolver):
             end_pos += 1
 
         # the color can be placed in every cell
-        return all(cell & color
-                   for cell in self.line[position: end_pos])
+        block_mask = (1 << (end_pos - position)) - 1
+        return (self._color_masks[color] >> position) & block_mask == block_mask
 
     def add_cell_color(self, position, value):
+        """sets a cell in the solution matrix"""
+
         self.solved_line[position] |= value
 
+    def set_sol(self, position, block, value):
+        """
+        sets a value in the solution matrix
+        so we wont calculate this value recursively anymore
+        """
+        if position < 0:
+            return
+
+        self.sol[block][position] = SOLVABLE if value else NOT_SOLVABLE
+
+    def get_sol(self, position, block):
+        """
+        gets the value from the solution matrix
+        if the value is missing, we calculate it recursively
+        """
+
+        if position == -1:
+            # finished placing the last block, exactly at the beginning of the line.
+            return block == 0
+
+        can_be_solved = self.sol[block][position]
+        if not can_be_solved:
+            if self.fill_matrix_top_down(position, block):
+                can_be_solved = SOLVABLE
+            else:
+                can_be_solved = NOT_SOLVABLE
+            self.sol[block][position] = can_be_solved
+
+        return can_be_solved == SOLVABLE
+
     def set_color_block(self, start_pos, end_pos, color, trailing_space=True):
         """
         sets a block in the solution matrix. all cells are painted black,
@@ -390,6 +625,15 @@ class BlottedSolver(BaseLineSolver):
     def _is_blotted(cls, block):
         raise NotImplementedError()
 
+    @classmethod
+    def _is_feasible(cls, description, line):
+        """
+        Cheap O(n) check that the line does not obviously contradict
+        the (fully defined) description, so the full DP can be skipped.
+        False positives are allowed, false negatives are not.
+        """
+        raise NotImplementedError()
+
     @classmethod
     def _update_block(cls, current, increase):
         raise NotImplementedError()
@@ -441,6 +685,11 @@ class BlottedSolver(BaseLineSolver):
 
             LOG.debug('Trying %i-th combination %r', index, current_description)
 
+            if not cls._is_feasible(current_description, line):
+                LOG.debug('Combination %r is not feasible for line %r',
+                          current_description, line)
+                continue
+
             try:
                 solved = tuple(super(BlottedSolver, cls).solve(current_description, line))
             except NonogramError:
@@ -483,6 +732,17 @@ class BguBlottedSolver(BlottedSolver, BguSolver):
     def _is_blotted(cls, block):
         return block == BlottedBlock
 
+    @classmethod
+    def _is_feasible(cls, description, line):
+        boxes = sum(description)
+
+        # too many boxes already solved
+        if line.count(BOX) > boxes:
+            return False
+
+        # not enough cells left to place all the boxes
+        return len(line) - line.count(SPACE) >= boxes
+
     @classmethod
     def _update_block(cls, current, increase):
         return current + increase
@@ -502,7 +762,7 @@ class BguColoredBlottedSolver(TrimmedSolver, BlottedSolver, BguColoredSolver):
 
     @classmethod
     def is_solved(cls, description, line):
-        if any(len(two_powers(cell)) > 1 for cell in line):
+        if not all(is_power_of_two(cell) for cell in line):
             return False
 
         return BlottedBlock.matches(description, line)
@@ -516,6 +776,23 @@ class BguColoredBlottedSolver(TrimmedSolver, BlottedSolver, BguColoredSolver):
     def _is_blotted(cls, block):
         return block.size == BlottedBlock
 
+    @classmethod
+    def _is_feasible(cls, description, line):
+        color_sizes = defaultdict(int)
+        for size, color in description:
+            color_sizes[color] += size
+
+        for color, size in color_sizes.items():
+            # too many cells already solved with that color
+            if sum(1 for cell in line if cell == color) > size:
+                return False
+
+            # not enough cells left to place all the blocks of that color
+            if sum(1 for cell in line if cell & color) < size:
+                return False
+
+        return True
+
     @classmethod
     def _update_block(cls, current, increase):
         return ColorBlock(current.size + increase, current.color)
@@ -536,7 +813,7 @@ class BguColoredBlottedSolver(TrimmedSolver, BlottedSolver, BguColoredSolver):
             for single_color in two_powers(cell):
                 allowed_colors_positions[single_color].append(index)
 
-        min_start_indexes = cls.calc_block_sum(description)[1:]
+        min_start_indexes = list(cls.calc_block_sum(description)[1:])
         LOG.debug(min_start_indexes)
 
         for block_index, block in enumerate(description):
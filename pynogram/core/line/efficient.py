@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-Dynamic programming algorithm to solve nonograms (using recursion)
+Dynamic programming algorithm to solve nonograms
 
 See details in the work 'An Efficient Approach to Solving Nonograms':
 https://ir.nctu.edu.tw/bitstream/11536/22772/1/000324586300005.pdf
@@ -9,26 +9,201 @@ https://ir.nctu.edu.tw/bitstream/11536/22772/1/000324586300005.pdf
 from __future__ import unicode_literals
 
 import logging
+from itertools import groupby
 
 from six.moves import zip
 
 from pynogram.core.common import (
     UNKNOWN, BOX,
     SPACE, SPACE_COLORED,
+    PAINTED_CELLS,
     partial_sums,
 )
 from pynogram.core.line.base import (
     BaseLineSolver,
     NonogramError,
 )
-from pynogram.utils.other import from_two_powers
 
 LOG = logging.getLogger(__name__)
 
 
+# The following functions are the core of the solvers.
+# They intentionally deal only with the plain integers and bytearrays
+# and do not access any attributes, so the interpreter (or PyPy JIT)
+# can run the loops as tight as possible.
+
+def fix_table(sizes, min_lengths, line_size, can_space, can_box):
+    """
+    Build the table of the `fix(i, j)` values bottom-up:
+    every value depends only on the values with the smaller `i`,
+    so the single pass is enough.
+
+    The value for (i, j) is located at the index (i + 1) * width + (j + 1)
+
+    :param sizes: the blocks sizes
+    :param min_lengths: the minimum line sizes for every block
+    :param line_size: the length of the line
+    :param can_space: the mask of cells that can be spaces
+    :param can_box: the mask of cells that can be boxes
+    """
+    width = len(sizes) + 1
+    table = bytearray(width * (line_size + 1))
+
+    # the size of the line occupied by the blocks from 0 to (j-1)-th
+    occupied = [0] + [length + 1 for length in min_lengths]
+    last_block = len(sizes) - 1
+
+    # (i=-1, j=-1): empty line with no blocks
+    table[0] = 1
+
+    first_block = 0
+    for i in range(line_size):
+        row_start = (i + 1) * width
+        space_at_i = (can_space >> i) & 1
+
+        # (i, -1): all the cells can be spaces
+        if space_at_i and table[row_start - width]:
+            table[row_start] = 1
+
+        # the states where the blocks after the j-th do not fit
+        # into the rest of the line are never reached, so skip them
+        while first_block < last_block and (
+                occupied[-1] - occupied[first_block + 1] > line_size - 1 - i):
+            first_block += 1
+
+        for j in range(first_block, last_block + 1):
+            if i < min_lengths[j]:
+                break
+
+            block_size = sizes[j]
+
+            index = row_start + j + 1
+
+            # fix0: (i-1, j)
+            if space_at_i and table[index - width]:
+                table[index] = 1
+                continue
+
+            # fix1: the block ends at i-th cell
+            # and preceded with a space at the `start`
+            start = i - block_size
+            if start >= 0 and (can_space >> start) & 1:
+                block_mask = (1 << block_size) - 1
+                if (can_box >> (start + 1)) & block_mask == block_mask:
+                    # (start-1, j-1)
+                    table[index] = table[start * width + j]
+
+    return table
+
+
+def colored_fix_table(blocks, min_lengths, line_size, can_space):
+    """
+    The same as `fix_table` but for the colored line.
+
+    :param blocks: for every block the tuple of
+    (size, mask of cells that can have the block's color,
+     number of cells occupied with the preceding space,
+     whether the block is preceded with a space)
+    :param min_lengths: the minimum line sizes for every block
+    :param line_size: the length of the line
+    :param can_space: the mask of cells that can be spaces
+    """
+    width = len(blocks) + 1
+    table = bytearray(width * (line_size + 1))
+
+    # the size of the line occupied by the blocks from 0 to (j-1)-th
+    occupied = [0] + [length + 1 for length in min_lengths]
+    last_block = len(blocks) - 1
+
+    # (i=-1, j=-1): empty line with no blocks
+    table[0] = 1
+
+    first_block = 0
+    for i in range(line_size):
+        row_start = (i + 1) * width
+        space_at_i = (can_space >> i) & 1
+
+        # (i, -1): all the cells can be spaces
+        if space_at_i and table[row_start - width]:
+            table[row_start] = 1
+
+        while first_block < last_block and (
+                occupied[-1] - occupied[first_block + 1] > line_size - 1 - i):
+            first_block += 1
+
+        for j in range(first_block, last_block + 1):
+            if i < min_lengths[j]:
+                break
+
+            index = row_start + j + 1
+
+            # fix0: (i-1, j)
+            if space_at_i and table[index - width]:
+                table[index] = 1
+                continue
+
+            size, color_mask, span, preceding_space = blocks[j]
+
+            # the block ends at i-th cell, and the preceding
+            # space (if required) is at the (start-1)-th one
+            start = i - size + 1
+            if preceding_space and not (can_space >> (start - 1)) & 1:
+                continue
+
+            block_mask = (1 << size) - 1
+            if (color_mask >> start) & block_mask == block_mask:
+                # (i-span, j-1)
+                table[index] = table[(i - span + 1) * width + j]
+
+    return table
+
+
+def paint_masks(table, sizes, line_size, can_space, can_box):
+    """
+    Walk backwards through all the reachable states of the `fix` table
+    and collect the cells that can be spaces or boxes.
+
+    Return the pair of masks: (can be spaces, can be boxes)
+    """
+    width = len(sizes) + 1
+    reachable = bytearray(len(table))
+    reachable[len(table) - 1] = 1
+
+    spaces = boxes = 0
+    for i in range(line_size - 1, -1, -1):
+        row_start = (i + 1) * width
+
+        # the only solution for the rest of the line:
+        # all the cells are spaces
+        if reachable[row_start]:
+            spaces |= (1 << (i + 1)) - 1
+
+        space_at_i = (can_space >> i) & 1
+        for j in range(len(sizes) - 1, -1, -1):
+            index = row_start + j + 1
+            if not reachable[index]:
+                continue
+
+            if space_at_i and table[index - width]:
+                spaces |= 1 << i
+                reachable[index - width] = 1
+
+            block_size = sizes[j]
+            start = i - block_size
+            if start >= 0 and (can_space >> start) & 1:
+                block_mask = (1 << block_size) - 1
+                if (can_box >> (start + 1)) & block_mask == block_mask:
+                    if table[start * width + j]:
+                        spaces |= 1 << start
+                        boxes |= block_mask << (start + 1)
+                        reachable[start * width + j] = 1
+
+    return spaces, boxes
+
+
 class EfficientSolver(BaseLineSolver):
     """
-    Recursive nonogram line solver.
+    Dynamic programming nonogram line solver.
     Adapted from the work 'An Efficient Approach to Solving Nonograms'
     """
 
@@ -38,23 +213,46 @@ class EfficientSolver(BaseLineSolver):
         self.minimum_lengths = self.min_lengths(self.description)
         self.additional_space = self._set_additional_space()
 
+        # the additional space is not really prepended to the line,
+        # all the cells are simply shifted by one position
+        self._line_offset = 1 if self.additional_space else 0
+        self._line_size = len(self.line) + self._line_offset
+
+        self._can_space, self._can_box = self._line_masks()
+
         self._cache_width = len(self.description) + 1
-        self._fix_table = self._init_tables()
-        self._paint_table = self._init_tables()
+        self._fix_table = None
 
-    def _init_tables(self):
-        cache_height = len(self.line) + 1
-        return [None] * (self._cache_width * cache_height)
+    def _table_size(self):
+        cache_height = self._line_size + 1
+        return self._cache_width * cache_height
 
     def _linear_index(self, i, j):
         return (i + 1) * self._cache_width + (j + 1)
 
     def _set_additional_space(self):
-        space = self.empty_cell()
-        if self.line[0] != space:
-            self.line = (space,) + self.line
-            return True
-        return False
+        """
+        Whether the line should be extended with the leading space,
+        so every block (even the first one) is preceded with a space
+        """
+        return self.line[0] != self.empty_cell()
+
+    def _line_masks(self):
+        """
+        Represent the line as two integer bitmasks:
+        the k-th bit is set if the k-th cell can be a space (a box)
+        """
+        can_space = can_box = 0
+        if self.additional_space:
+            can_space = 1
+
+        for k, cell in enumerate(self.line, self._line_offset):
+            if self._can_be_space(cell):
+                can_space |= 1 << k
+            if self._can_be_box(cell):
+                can_box |= 1 << k
+
+        return can_space, can_box
 
     @classmethod
     def min_lengths(cls, description):
@@ -69,52 +267,27 @@ class EfficientSolver(BaseLineSolver):
         """
         Verify whether blocks from 0 to (j-1)-th
         can be resided inside a substring line[:i+1]
+
+        The table should be filled with `_fill_fix_table` beforehand.
         """
 
-        fixable = self._fix_table[self._linear_index(i, j)]
-        if fixable is None:
-            fixable = self._fix(i, j)
-            self._fix_table[self._linear_index(i, j)] = fixable
-        return fixable
+        return self._fix_table[self._linear_index(i, j)]
+
+    def _fill_fix_table(self):
+        self._fix_table = fix_table(
+            self.description, self.minimum_lengths,
+            self._line_size, self._can_space, self._can_box)
 
     @classmethod
     def _can_be_space(cls, cell):
         return cell in (SPACE, UNKNOWN)
 
-    def _fix_border_conditions(self, i, j):
-        if j < 0:
-            assert j == -1
-
-            if i < 0:
-                return True
-
-            # NB: improvement
-            return all(map(self._can_be_space, self.line[:i + 1]))
-
-        # reached the beginning of the line
-        if i < 0:
-            assert i == -1
-
-            # no more blocks to fill
-            return j < 0
-
-        if i < self.minimum_lengths[j]:
-            return False
-
-        return None
-
-    def _fix(self, i, j):
-        """
-        Determine whether S[:i+1] is fixable with respect to D[:j+1]
-        :param i: line size
-        :param j: block number
-        """
-        res = self._fix_border_conditions(i, j)
-        if res is not None:
-            return res
+    @classmethod
+    def _can_be_box(cls, cell):
+        return cell in (BOX, UNKNOWN)
 
-        res = self._fix0(i, j) or self._fix1(i, j)
-        return res
+    def _can_be_space_at(self, i):
+        return (self._can_space >> i) & 1
 
     def _fix0(self, i, j):
         """
@@ -124,38 +297,11 @@ class EfficientSolver(BaseLineSolver):
         :param j: block number
         """
 
-        if self._can_be_space(self.line[i]):
+        if self._can_be_space_at(i):
             return self.fix(i - 1, j)
 
         return False
 
-    def _fix1(self, i, j):
-        """
-        Determine whether S[:i+1] is fixable with respect to D[:j+1]
-        in assumption that S[i] can be 1
-        :param i: line size
-        :param j: block number
-        """
-        block_size = self.description[j]
-        if j >= 0 and i >= block_size:
-            block = self.line[i - block_size: i + 1]
-            if self._is_space_with_block(block):
-                return self.fix(i - block_size - 1, j - 1)
-
-        return False
-
-    @classmethod
-    def _is_space_with_block(cls, line):
-        if cls._can_be_space(line[0]):
-            if all(pixel in (BOX, UNKNOWN) for pixel in line[1:]):
-                return True
-
-        return False
-
-    @classmethod
-    def _space_with_block(cls, block_size):
-        return [cls.empty_cell()] + ([BOX] * block_size)
-
     @classmethod
     def empty_cell(cls):
         """
@@ -163,83 +309,130 @@ class EfficientSolver(BaseLineSolver):
         """
         return SPACE
 
-    def paint(self, i, j):
-        """
-        Paint unsolved cells of line[:i+1]
-        using blocks from 0 to (j+1)-th as description
-        """
-        if i < 0:
-            return []
-
-        painted = self._paint_table[self._linear_index(i, j)]
-        if painted is None:
-            if j < 0:
-                if all(map(self._can_be_space, self.line[:i + 1])):
-                    painted = [self.empty_cell()] * (i + 1)
-                else:
-                    raise NonogramError('Excess cells found at the beginning')
-            else:
-                painted = self._paint(i, j)
+    def _check_fixable(self):
+        line_size = self._line_size
+        last_block = len(self.description) - 1
 
-            self._paint_table[self._linear_index(i, j)] = painted
+        if not self.fix(line_size - 1, last_block):
+            if last_block < 0:
+                raise NonogramError('Excess cells found at the beginning')
+            raise NonogramError('Block %r not fixable at position %r' % (
+                last_block, line_size - 1))
 
-        return painted
-
-    def _paint(self, i, j):
-        fix0 = self._fix0(i, j)
-        fix1 = self._fix1(i, j)
-
-        if fix0:
-            if fix1:
-                return self._paint_both(i, j)
+    def _paint_line(self):
+        line_size = self._line_size
+        spaces, boxes = paint_masks(
+            self._fix_table, self.description,
+            line_size, self._can_space, self._can_box)
 
-            return self._paint0(i, j)
+        # the binary representation of the masks with the first cell going first
+        # (the additional high bit preserves the leading zeros),
+        # without the additional space
+        offset = self._line_offset
+        spaces_bits = bin(spaces | (1 << line_size))[:2:-1][offset:]
+        boxes_bits = bin(boxes | (1 << line_size))[:2:-1][offset:]
 
-        if fix1:
-            return self._paint1(i, j)
+        return [PAINTED_CELLS[bits] for bits in zip(spaces_bits, boxes_bits)]
 
-        raise NonogramError('Block %r not fixable at position %r' % (j, i))
-
-    def _paint0(self, i, j):
-        return self.paint(i - 1, j) + [self.empty_cell()]
+    def _solve_trivial(self):
+        """
+        Solve the line without the `fix` table if it is
+        already solved or is completely unknown.
 
-    def _paint1(self, i, j):
-        block_size = self.description[j]
-        return self.paint(i - block_size - 1, j - 1) + self._space_with_block(block_size)
+        Return None if the line is neither of those.
+        """
+        line_size = len(self.line)
+        line_mask = ((1 << line_size) - 1) << self._line_offset
+        # the empty line can be described as (0,)
+        description = tuple(size for size in self.description if size)
+
+        if not self._can_space & self._can_box:
+            blocks = tuple(len(tuple(group)) for cell, group in groupby(self.line) if cell == BOX)
+            if blocks != description:
+                raise NonogramError('The solved line has blocks %r' % (blocks,))
+            return self.line
+
+        if self._can_space & self._can_box != line_mask:
+            return None
+
+        if not description:
+            return [SPACE] * line_size
+
+        slack = line_size - self.minimum_lengths[-1] - 1
+        if slack < 0:
+            # let the full algorithm report the error
+            return None
+
+        res = [UNKNOWN] * line_size
+        start = 0
+        for size in description:
+            # the overlapping part of the leftmost and the rightmost positions
+            for k in range(start + slack, start + size):
+                res[k] = BOX
+            start += size + 1
+
+        if slack == 0:
+            res = [BOX if cell == BOX else SPACE for cell in res]
 
-    @classmethod
-    def _merge_iter(cls, line1, line2):
-        for pixel1, pixel2 in zip(line1, line2):
-            if pixel1 == pixel2:
-                yield pixel1
-            else:
-                yield UNKNOWN
-
-    def _paint_both(self, i, j):
-        return list(self._merge_iter(
-            self._paint0(i, j),
-            self._paint1(i, j)
-        ))
+        return res
 
     def _solve(self):
-        res = self.paint(len(self.line) - 1, len(self.description) - 1)
-        if self.additional_space:
-            res = res[1:]
+        res = self._solve_trivial()
+        if res is not None:
+            return res
 
-        return res
+        self._fill_fix_table()
+        self._check_fixable()
+
+        return self._paint_line()
 
 
 class EfficientColorSolver(EfficientSolver):
-    """Recursive nonogram solver for colored puzzles"""
+    """Dynamic programming nonogram solver for colored puzzles"""
 
     def __init__(self, description, line):
         super(EfficientColorSolver, self).__init__(description, line)
 
         self.colors = set(color for size, color in self.description)
+        self._block_spans, self._preceding_spaces = self._blocks_layout()
+        self._color_masks = self._colors_masks()
+
+    def _colors_masks(self):
+        """
+        For every color of the description build a bitmask
+        where the k-th bit is set if the k-th cell can have that color
+        """
+        masks = dict.fromkeys(self.colors, 0)
+        for k, cell in enumerate(self.line):
+            for color in self.colors:
+                if cell & color:
+                    masks[color] |= 1 << k
+
+        return masks
+
+    def _blocks_layout(self):
+        """
+        For every block calculate the number of cells it occupies
+        and whether it should be preceded with a space
+        (only if the previous block has the same color).
+        """
+        spans, preceding_spaces = [], []
+
+        prev_color = None
+        for size, color in self.description:
+            preceding_space = color == prev_color
+            preceding_spaces.append(preceding_space)
+            spans.append(size + 1 if preceding_space else size)
+            prev_color = color
+
+        return spans, preceding_spaces
 
     def _set_additional_space(self):
         return False
 
+    def _solve_trivial(self):
+        return None
+
     @classmethod
     def min_lengths(cls, description):
         min_indexes = [s - 1 for s in partial_sums(description, colored=True)]
@@ -254,118 +447,88 @@ class EfficientColorSolver(EfficientSolver):
         # not (len(cell) == 1 and cell[0] in self.colors)
         return cls.empty_cell() & cell
 
-    def _fix(self, i, j):
-        res = self._fix_border_conditions(i, j)
-        if res is not None:
-            return res
-
-        color = self.description[j].color
-        return self._fix0(i, j) or self._fix_colored(i, j, color)
-
-    def _precede_with_space(self, j):
-        current_color = self.description[j].color
+    @classmethod
+    def _can_be_box(cls, cell):
+        return cell & ~cls.empty_cell()
 
-        if j > 0:
-            prev_color = self.description[j - 1].color
-            if prev_color == current_color:
-                return True
+    def _fill_fix_table(self):
+        blocks = [
+            (size, self._color_masks[color], span, preceding_space)
+            for (size, color), span, preceding_space in zip(
+                self.description, self._block_spans, self._preceding_spaces)
+        ]
 
-        return False
+        self._fix_table = colored_fix_table(
+            blocks, self.minimum_lengths, self._line_size, self._can_space)
 
     def _fix_colored(self, i, j, color):
         if j < 0:
             return False
 
-        size, desc_color = self.description[j]
-        if color != desc_color:
+        if color != self.description[j].color:
             return False
 
-        preceding_space = self._precede_with_space(j)
-
-        if preceding_space:
-            block_size = size + 1
-        else:
-            block_size = size
-
+        block_size = self._block_spans[j]
         if i >= block_size - 1:
-            block = self.line[i - block_size + 1: i + 1]
-
-            if self._can_be_colored(block, color, preceding_space=preceding_space):
+            if self._can_be_colored(i, j):
                 return self.fix(i - block_size, j - 1)
 
         return False
 
-    @classmethod
-    def _can_be_colored(cls, line, color, preceding_space=True):
-        if preceding_space:
-            if cls._can_be_space(line[0]):
-                # ignore the space header
-                line = line[1:]
-            else:
-                return False
-
-        return all(color & cell for cell in line)
-
-    @classmethod
-    def _color_block(cls, block_size, color, preceding_space=True):
-        block = []
-        if preceding_space:
-            block = [cls.empty_cell()]
-            block_size -= 1
-
-        block += [color] * block_size
-        return block
-
-    def _paint(self, i, j):
-        fix0 = self._fix0(i, j)
-
-        fix_colors = []
-        for color in self.colors:
-            if self._fix_colored(i, j, color):
-                fix_colors.append(color)
-
-        if fix0:
-            if fix_colors:
-                fix_colors.append(self.empty_cell())
-                return self._paint_all(i, j, fix_colors)
+    def _can_be_colored(self, i, j):
+        """
+        Whether the j-th block (with the preceding space if required)
+        can be placed to end in the i-th cell
+        """
+        size, color = self.description[j]
+        start = i - size + 1
 
-            return self._paint0(i, j)
+        if self._preceding_spaces[j]:
+            if not self._can_be_space_at(start - 1):
+                return False
 
-        if fix_colors:
-            return self._paint_all(i, j, fix_colors)
+        block_mask = (1 << size) - 1
+        return (self._color_masks[color] >> start) & block_mask == block_mask
 
-        raise NonogramError('Block %r not fixable at position %r' % (j, i))
+    def _paint_line(self):
+        """
+        Walk backwards through all the reachable states of the `fix` table
+        and merge all the colors every cell can have
+        """
+        line_size = self._line_size
+        space = self.empty_cell()
 
-    def _paint_color(self, i, j):
-        size, color = self.description[j]
+        painted = [0] * line_size
+        # all the cells before (and including) this one can be spaces
+        spaces_prefix = -1
 
-        preceding_space = self._precede_with_space(j)
+        reachable = bytearray(self._table_size())
+        reachable[-1] = 1
 
-        if preceding_space:
-            block_size = size + 1
-        else:
-            block_size = size
+        for i in range(line_size - 1, -1, -1):
+            if reachable[self._linear_index(i, -1)]:
+                spaces_prefix = max(spaces_prefix, i)
 
-        prev = self.paint(i - block_size, j - 1)
-        this = self._color_block(block_size, color, preceding_space=preceding_space)
-        return prev + this
+            for j in range(len(self.description) - 1, -1, -1):
+                if not reachable[self._linear_index(i, j)]:
+                    continue
 
-    @classmethod
-    def _merge(cls, *s):
-        if len(s) == 1:
-            return s[0]
+                if self._fix0(i, j):
+                    painted[i] |= space
+                    reachable[self._linear_index(i - 1, j)] = 1
 
-        res = []
-        for cells in zip(*s):
-            res.append(from_two_powers(cells))
+                size, color = self.description[j]
+                if self._fix_colored(i, j, color):
+                    start = i - self._block_spans[j] + 1
+                    if self._preceding_spaces[j]:
+                        painted[start] |= space
 
-        return res
+                    for k in range(i - size + 1, i + 1):
+                        painted[k] |= color
 
-    def _paint_all(self, i, j, colors):
-        lines = []
-        if self.empty_cell() in colors:
-            lines.append(self._paint0(i, j))
+                    reachable[self._linear_index(start - 1, j - 1)] = 1
 
-        lines.append(self._paint_color(i, j))
+        for k in range(spaces_prefix + 1):
+            painted[k] |= space
 
-        return self._merge(*lines)
+        return painted
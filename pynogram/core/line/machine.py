@@ -9,11 +9,14 @@ http://window.edu.ru/resource/781/57781
 from __future__ import unicode_literals, print_function
 
 import logging
+from collections import defaultdict
+from functools import reduce
+from operator import and_
 
 from six import (
     iteritems, itervalues,
 )
-from six.moves import range
+from six.moves import range, zip
 
 from pynogram.core.common import (
     UNKNOWN, BOX, SPACE, SPACE_COLORED,
@@ -24,10 +27,11 @@ from pynogram.core.common import (
 from pynogram.core.line.base import BaseLineSolver
 from pynogram.core.line.simpson import FastSolver
 from pynogram.utils import fsm
-from pynogram.utils.cache import Cache
+from pynogram.utils.cache import lru_cache
 from pynogram.utils.iter import expand_generator
 from pynogram.utils.other import (
     two_powers, from_two_powers,
+    is_power_of_two,
     get_named_logger,
 )
 
@@ -48,6 +52,42 @@ class NonogramFSM(fsm.FiniteStateMachine):
         final = state_map[-1][1]
         super(NonogramFSM, self).__init__(initial_state, state_map, final=final)
 
+        self._symbols, self._transitions = self._flat_transitions(self.state_map)
+        self._readable_types_cache = {}
+        self._next_states_bits_cache = {}
+
+    @classmethod
+    def _flat_transitions(cls, state_map):
+        """
+        Represent the state map as a dense table.
+        The new state after applying the action in some state
+        is located at the index (state * symbols_count + symbol_index).
+
+        Return the mapping {action: symbol_index} and the table itself.
+        """
+        actions = sorted(set(action for _, action in state_map))
+        symbols = {action: index for index, action in enumerate(actions)}
+        states_count = 1 + max(itervalues(state_map))
+
+        transitions = [None] * (states_count * len(symbols))
+        for (state, action), new_state in iteritems(state_map):
+            transitions[state * len(symbols) + symbols[action]] = new_state
+
+        return symbols, transitions
+
+    def reaction(self, action, current_state=None):
+        if current_state is None:
+            current_state = self.current_state
+
+        index = self._symbols.get(action)
+        if index is None:
+            return None
+
+        try:
+            return self._transitions[current_state * len(self._symbols) + index]
+        except IndexError:
+            return None
+
     @classmethod
     def _space(cls):
         return SPACE
@@ -59,12 +99,15 @@ class NonogramFSM(fsm.FiniteStateMachine):
         """
         return cell in (UNKNOWN, cls._space())
 
+    _SPACE_CELLS = frozenset((UNKNOWN, SPACE))
+
     @classmethod
     def _can_be_empty(cls, row):
         """
         Whether the row can contain only spaces
         """
-        return all(cls._can_be_space(cell) for cell in row)
+        # the check is done in a single C-level pass
+        return cls._SPACE_CELLS.issuperset(row)
 
     @classmethod
     def _optional_space(cls, state):
@@ -136,43 +179,56 @@ class NonogramFSM(fsm.FiniteStateMachine):
         """
         row = normalize_row(row)
 
-        # save the state in case of something change it
-        save_state = self.current_state
+        next_on_box = self._next_states_bits(BOX)
+        next_on_space = self._next_states_bits(SPACE)
 
-        try:
-            possible_states = {self.initial_state}
+        # the set of possible states is represented as a bitset
+        possible_states = 1 << self.initial_state
 
-            for i, cell in enumerate(row):
-                step_possible_states = []
-                for state in possible_states:
-                    if cell in (BOX, UNKNOWN):
-                        LOG.debug('Check the ability to insert BOX')
+        for i, cell in enumerate(row):
+            can_be_box = cell in (BOX, UNKNOWN)
+            can_be_space = cell in (SPACE, UNKNOWN)
 
-                        next_step = self.reaction(BOX, current_state=state)
-                        if next_step is None:
-                            LOG.debug('Cannot go from state %r with BOX', state)
-                        else:
-                            step_possible_states.append(next_step)
+            step_possible_states = 0
+            states = possible_states
+            while states:
+                lowest_bit = states & -states
+                state = lowest_bit.bit_length() - 1
+                states ^= lowest_bit
 
-                    if cell in (SPACE, UNKNOWN):
-                        LOG.debug('Check the ability to insert SPACE')
+                if can_be_box:
+                    step_possible_states |= next_on_box[state]
+                if can_be_space:
+                    step_possible_states |= next_on_space[state]
 
-                        next_step = self.reaction(SPACE, current_state=state)
-                        if next_step is None:
-                            LOG.debug('Cannot go from state %r with SPACE', state)
-                        else:
-                            step_possible_states.append(next_step)
+            if not step_possible_states:
+                LOG.debug('No possible states after step %s', i)
+                return False
 
-                if not step_possible_states:
-                    return False
+            possible_states = step_possible_states
 
-                LOG.debug('Possible states after step %s: %s', i, step_possible_states)
-                possible_states = set(step_possible_states)
+        return bool((possible_states >> self.final_state) & 1)
 
-            LOG.debug('Possible states after full scan: %s', possible_states)
-            return self.final_state in possible_states
-        finally:
-            self._state = save_state
+    def _next_states_bits(self, action):
+        """
+        For every state get the bit of the state
+        that the machine goes to after applying the `action`
+        (or zero if the action cannot be applied)
+        """
+        cache = self._next_states_bits_cache
+        bits = cache.get(action)
+        if bits is None:
+            states_count = len(self._transitions) // len(self._symbols)
+
+            bits = [0] * states_count
+            for state in range(states_count):
+                new_state = self.reaction(action, current_state=state)
+                if new_state is not None:
+                    bits[state] = 1 << new_state
+
+            cache[action] = bits
+
+        return bits
 
     def solve_with_partial_match(self, row):
         """
@@ -185,13 +241,16 @@ class NonogramFSM(fsm.FiniteStateMachine):
 
         # do not change original
         solved = list(original_row)
+
+        # the single buffer for all the guesses:
+        # the guessed cell gets restored after each trial
+        temp_row = list(original_row)
         for i, cell in enumerate(original_row):
             if cell in (BOX, SPACE):
                 continue
 
             LOG.debug('Trying to guess the %s cell', i)
 
-            temp_row = list(original_row)
             temp_row[i] = BOX
             can_be_box = self.partial_match(temp_row)
             LOG.debug('The %s cell can%s be a BOX',
@@ -202,6 +261,8 @@ class NonogramFSM(fsm.FiniteStateMachine):
             LOG.debug('The %s cell can%s be a SPACE',
                       i, '' if can_be_space else 'not')
 
+            temp_row[i] = cell
+
             if can_be_box:
                 if not can_be_space:
                     solved[i] = BOX
@@ -213,45 +274,57 @@ class NonogramFSM(fsm.FiniteStateMachine):
                         i, cell, original_row))
         return solved
 
+    _TYPES_FOR_CELL = {
+        BOX: (BOX,),
+        SPACE: (SPACE,),
+        UNKNOWN: (BOX, SPACE),
+    }
+
     @classmethod
     def _types_for_cell(cls, cell):
-        if cell in (BOX, SPACE):
-            return cell,
+        return cls._TYPES_FOR_CELL.get(cell, ())
 
-        if cell == UNKNOWN:
-            return BOX, SPACE
+    def _readable_types(self, cell):
+        """
+        The pairs (cell_type, symbol_index) for every type
+        that the cell can be and the machine can read.
+
+        The result is cached on the machine,
+        so the same cell values are resolved only once.
+        """
+        cache = self._readable_types_cache
+        types = cache.get(cell)
+        if types is None:
+            symbols = self._symbols
+            types = tuple(
+                (_type, symbols[_type])
+                for _type in self._types_for_cell(cell) if _type in symbols)
+            cache[cell] = types
 
-        return ()
+        return types
 
     def _make_transition_table(self, row):
-        # for each read cell store a list of StepState
+        # for each read cell store a layer of transitions
         # plus O-th for the state before any read cells
         transition_table = TransitionTable.with_capacity(len(row) + 1)
         transition_table.append_transition(0, self.initial_state)
 
-        def _shift_one_cell(cell_type, trans_index,
-                            previous_step_state, previous_state, desc_cell=None):
-            if desc_cell:  # pragma: no cover
-                LOG.debug('Add states with %s transition', desc_cell)
-
-            new_state = self.reaction(cell_type, previous_state)
-            if new_state is None:
-                if desc_cell:  # pragma: no cover
-                    LOG.debug('Cannot go from %s with the %s cell', previous_state, desc_cell)
-            else:
-                transition_table.append_transition(
-                    trans_index, new_state, previous_step_state, cell_type)
-
         # optimize lookups
-        _types_for_cell = self._types_for_cell
+        readable_types = self._readable_types
+        append_transition = transition_table.append_transition
+        symbols_count = len(self._symbols)
+        transitions = self._transitions
 
         for i, cell in enumerate(row):
             transition_index = i + 1
+            cell_types = readable_types(cell)
 
-            for prev_state, prev in iteritems(transition_table[i]):
-                for _type in _types_for_cell(cell):
-                    _shift_one_cell(_type, transition_index,
-                                    prev, prev_state)
+            for prev_state in transition_table[i].unique_states():
+                offset = prev_state * symbols_count
+                for _type, symbol_index in cell_types:
+                    new_state = transitions[offset + symbol_index]
+                    if new_state is not None:
+                        append_transition(transition_index, new_state, prev_state, _type)
 
         return transition_table
 
@@ -294,42 +367,73 @@ class NonogramFSM(fsm.FiniteStateMachine):
                 if space == self._space():
                     return True
 
-        return super(NonogramFSM, self).match(word)
+        # the machine can be shared, so do not leave it in the changed state
+        save_state = self.current_state
+        try:
+            return super(NonogramFSM, self).match(word)
+        finally:
+            self._state = save_state
 
 
-class _StepState(object):
+class TransitionLayer(object):
     """
-    Stores state of the machine,
-    the link to the previous StepState object
-    and the list of transitions which led to this state
+    Stores all the transitions that lead the machine
+    to the new states after reading a single cell.
+
+    Every transition is stored as the items of three parallel lists:
+    (new state, previous state, the type of the read cell)
+
+    The index of the transitions grouped by the new state
+    is not needed for the forward pass, so it builds lazily.
     """
 
-    __slots__ = ['state', 'previous_states']
+    __slots__ = ['states', 'prev_states', 'cell_types', '_reverse_index']
+
+    def __init__(self):
+        self.states = []
+        self.prev_states = []
+        self.cell_types = []
+        self._reverse_index = None
+
+    def append(self, state, prev_state, cell_type):
+        """Add the transition `prev_state` --(cell_type)--> `state`"""
+        self.states.append(state)
+        self.prev_states.append(prev_state)
+        self.cell_types.append(cell_type)
+        self._reverse_index = None
+
+    def __contains__(self, state):
+        return state in self.states
 
-    def __init__(self, state, prev=None, cell_type=None):
-        # self.id = id(self)
-        self.state = state
-        self.previous_states = dict()
-        self.add_previous_state(prev, cell_type)
+    def unique_states(self):
+        """All the states the machine can be in after reading the cell"""
+        return set(self.states)
 
-    def add_previous_state(self, prev, cell_type):
+    def reverse_index(self):
         """
-        Add transition which led to the current StepState.
-        As a result it could be one or more pairs (StepState, cell_type).
+        The map from every new state to the list
+        of (previous state, the type of the read cell)
         """
-        if prev is not None:
-            self.previous_states[prev] = cell_type
+        index = self._reverse_index
+        if index is None:
+            index = defaultdict(list)
+            for state, prev, cell_type in zip(self.states, self.prev_states, self.cell_types):
+                index[state].append((prev, cell_type))
+
+            self._reverse_index = index = dict(index)
+
+        return index
 
     def __str__(self):
-        previous_states = sorted(
-            iteritems(self.previous_states),
-            key=lambda x: x[0].state)
+        reverse_index = self.reverse_index()
 
-        return '({}): [{}]'.format(
-            # self.id,
-            self.state,
-            ', '.join('{}<-{}'.format(prev.state, cell_type)
-                      for prev, cell_type in previous_states))
+        return '\n'.join(
+            '({}): [{}]'.format(state, ', '.join(
+                '{}<-{}'.format(prev, cell_type)
+                for prev, cell_type in sorted(
+                    transition for transition in reverse_index[state]
+                    if transition[0] is not None)))
+            for state in sorted(reverse_index))
 
 
 class TransitionTable(list):
@@ -340,33 +444,25 @@ class TransitionTable(list):
 
     @classmethod
     def with_capacity(cls, capacity):
-        """Generates a list of dicts with given capacity"""
-        return TransitionTable([dict() for _ in range(capacity)])
+        """Generates a list of empty layers with given capacity"""
+        return TransitionTable([TransitionLayer() for _ in range(capacity)])
 
     def append_transition(self, cell_index, state, prev=None, cell_type=None):
         """
-        Add transition that shifts from `prev` StepState
+        Add transition that shifts from `prev` state
         after reading `cell_index`-th cell from a row
         (which value is `cell_type`)
-        to the new StepState of given `state`
+        to the new `state`
         """
-        transition_row = self[cell_index]
-        if state in transition_row:
-            # LOG.debug('State %s already exists in transition table for cell %s',
-            #           state, cell_index)
-            transition_row[state].add_previous_state(prev, cell_type)
-        else:
-            transition_row[state] = _StepState(state, prev, cell_type)
+        self[cell_index].append(state, prev, cell_type)
 
     def __str__(self):
         res = []
-        for i, states in enumerate(self):
+        for i, layer in enumerate(self):
             if i > 0:
                 res.append('')
             res.append(i)
-            res.extend(sorted(itervalues(states), key=lambda x: x.state))
-            # for state, step in iteritems(states):
-            #     res.append('({}): {}'.format(state, step))
+            res.append(layer)
 
         return '\n'.join(map(str, res))
 
@@ -380,15 +476,17 @@ class TransitionTable(list):
         possible_states = {final_state}
 
         # ignore the first row, it's for pre-read state
-        for row in reversed(self[1:]):
+        for layer in reversed(self[1:]):
             step_possible_cell_types = set()
             step_possible_states = set()
 
-            for state in possible_states:
-                step = row[state]
-                for prev, cell_type in iteritems(step.previous_states):
+            # a single scan over the parallel lists is cheaper
+            # than building the full reverse index of the layer
+            for state, prev, cell_type in zip(
+                    layer.states, layer.prev_states, layer.cell_types):
+                if state in possible_states:
                     step_possible_cell_types.add(cell_type)
-                    step_possible_states.add(prev.state)
+                    step_possible_states.add(prev)
 
             possible_states = step_possible_states
             yield tuple(step_possible_cell_types)
@@ -407,6 +505,12 @@ class NonogramFSMColored(NonogramFSM):
     def _can_be_space(cls, cell):
         return bool(cell & cls._space())
 
+    @classmethod
+    def _can_be_empty(cls, row):
+        # the space bit survives the AND of all the cells
+        # only if every single cell has it
+        return bool(reduce(and_, row, cls._space()))
+
     @classmethod
     def _types_for_cell(cls, cell):
         return two_powers(cell)
@@ -420,9 +524,8 @@ class NonogramFSMColored(NonogramFSM):
         one_color_word = []
 
         for letter in word:
-            letter = two_powers(letter)
-            if len(letter) == 1:
-                letter = letter[0]
+            if not is_power_of_two(letter):
+                letter = two_powers(letter)
 
             one_color_word.append(letter)
 
@@ -436,10 +539,9 @@ class BaseMachineSolver(BaseLineSolver):
 
     def __init__(self, description, line):
         super(BaseMachineSolver, self).__init__(description, line)
-        self.nfsm = self.make_nfsm(description)
+        self.nfsm = self.shared_nfsm(description)
 
     NFSM_CLASS = NonogramFSM
-    FSM_CACHE = Cache(1000)
 
     @classmethod
     def get_state_map(cls, description):
@@ -449,17 +551,7 @@ class BaseMachineSolver(BaseLineSolver):
         from the nonogram description.
         Use cached value if available.
         """
-        nfsm_cls = cls.NFSM_CLASS
-
-        # if description and is_list_like(description[0]):
-        #     nfsm_cls = NonogramFSMColored
-
-        state_map = cls.FSM_CACHE.get(description)
-        if state_map is None:
-            state_map = nfsm_cls.state_map_from_description(description)
-            cls.FSM_CACHE.save(description, state_map)
-
-        return state_map
+        return _state_map_of(cls.NFSM_CLASS, description)
 
     @classmethod
     def make_nfsm(cls, *description):
@@ -476,6 +568,27 @@ class BaseMachineSolver(BaseLineSolver):
 
         return cls.NFSM_CLASS(description, state_map)
 
+    @classmethod
+    def shared_nfsm(cls, description):
+        """
+        Produce the finite state machine for nonogram solving
+        or take the already constructed one from the cache.
+
+        As the machine is shared between the solvers,
+        one should never change its current state.
+        """
+        return _nfsm_of(cls.NFSM_CLASS, normalize_description(description))
+
+
+@lru_cache(maxsize=1024)
+def _state_map_of(nfsm_cls, description):
+    return nfsm_cls.state_map_from_description(description)
+
+
+@lru_cache(maxsize=1024)
+def _nfsm_of(nfsm_cls, description):
+    return nfsm_cls(description, _state_map_of(nfsm_cls, description))
+
 
 class PartialMatchSolver(BaseMachineSolver):
     """
@@ -520,6 +633,6 @@ def assert_match(row_desc, row):
     Verifies that the given row matches the description
     """
 
-    nfsm = BaseMachineSolver.make_nfsm(row_desc)
+    nfsm = BaseMachineSolver.shared_nfsm(row_desc)
     if not nfsm.match(row):
         raise NonogramError('The row {!r} cannot fit in clue {!r}'.format(row, row_desc))
@@ -51,9 +51,10 @@ class FastSolver(BaseLineSolver):
         if clue_size > 0:
             res[current_block] = 0
 
-        LOG.info('Pushing clue: %s', ', '.join(map(str, clue)))
-        LOG.info('Pushing line: >%s<', ''.join(
-            _SYMBOL_MAP.get(cell, '?') for cell in line))
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info('Pushing clue: %s', ', '.join(map(str, clue)))
+            LOG.info('Pushing line: >%s<', ''.join(
+                _SYMBOL_MAP.get(cell, '?') for cell in line))
 
         while current_block < clue_size:
             # find first/next non-dot:
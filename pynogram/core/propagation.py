@@ -71,7 +71,8 @@ def solve_row(board, index, is_column, method):
     new_jobs = []
 
     # if board.line_solution_rate(updated) > pre_solution_rate:
-    if row != updated:
+    # the solvers return the same object if nothing changed
+    if updated is not row and row != updated:
         # LOG.debug('Queue: %s', jobs_queue)
         # LOG.debug(row)
         # LOG.debug(updated)
@@ -90,6 +91,24 @@ def solve_row(board, index, is_column, method):
     return new_jobs
 
 
+def default_methods(board):
+    """
+    The line solving methods to use for the given board.
+    They depend only on the kind of the board,
+    so the callers that solve the same board repeatedly can choose them once.
+    """
+    if board.is_colored:
+        if board.has_blots:
+            return ('blot_color',)
+        return ('bgu_color',)
+
+    if board.has_blots:
+        return ('blot',)
+
+    # return ('simpson', 'reverse_tracking')
+    return ('bgu',)
+
+
 def solve(board,
           row_indexes=None, column_indexes=None,
           contradiction_mode=False, methods=None):
@@ -104,17 +123,7 @@ def solve(board,
     """
 
     if methods is None:
-        if board.is_colored:
-            if board.has_blots:
-                methods = ('blot_color',)
-            else:
-                methods = ('bgu_color',)
-        else:
-            if board.has_blots:
-                methods = ('blot',)
-            else:
-                # methods = ('simpson', 'reverse_tracking')
-                methods = ('bgu',)
+        methods = default_methods(board)
 
     if not isinstance(methods, (tuple, list)):
         methods = [methods]
@@ -165,12 +174,8 @@ def _solve_with_method(
     LOG.debug('Solving %s rows and %s columns with %r method',
               row_indexes, column_indexes, method)
 
-    line_jobs = PriorityDict()
-    all_jobs = set()
-
-    def _add_job(job, _priority):
-        line_jobs[job] = _priority
-        all_jobs.add(job)
+    # the initial jobs are collected in the plain dict and heapified at once
+    initial_jobs = dict()
 
     if row_indexes is None:
         row_indexes = range(board.height)
@@ -191,7 +196,7 @@ def _solve_with_method(
             # the more attempts the less priority
             priority = board.attempts_to_try(*new_job)
 
-        _add_job(new_job, priority)
+        initial_jobs[new_job] = priority
 
     if column_indexes is None:
         column_indexes = range(board.width)
@@ -212,7 +217,10 @@ def _solve_with_method(
             # the more attempts the less priority
             priority = board.attempts_to_try(*new_job)
 
-        _add_job(new_job, priority)
+        initial_jobs[new_job] = priority
+
+    line_jobs = PriorityDict(initial_jobs)
+    all_jobs = set(initial_jobs)
 
     total_cells_solved = 0
 
@@ -221,18 +229,20 @@ def _solve_with_method(
         #          'column' if is_column else 'row', priority)
 
         new_jobs = solve_row(board, index, is_column, method)
+        lines_solved += 1
+        if not new_jobs:
+            continue
 
         total_cells_solved += len(new_jobs)
+        new_priority = priority - 1
         for new_job in new_jobs:
-            new_priority = priority - 1
-            if board.has_blots:
+            if has_blots:
                 # the more attempts the less priority
                 new_priority = board.attempts_to_try(*new_job)
 
             # lower priority = more priority
-            _add_job(new_job, new_priority)
-
-        lines_solved += 1
+            line_jobs[new_job] = new_priority
+        all_jobs.update(new_jobs)
 
     # all the following actions applied only to verified solving
     if not contradiction_mode:
@@ -5,22 +5,52 @@ Enables general-purpose cache
 
 from __future__ import unicode_literals, print_function
 
-from collections import defaultdict
+import atexit
+import hashlib
+import os
+import sqlite3
+from collections import (
+    OrderedDict,
+    defaultdict,
+)
 from functools import wraps
 from time import time
 
+from memoized import memoized
+from six.moves import cPickle as pickle
+
 from pynogram.utils.other import get_named_logger
 
+try:
+    from functools import lru_cache
+except ImportError:  # pragma: no cover
+    # Python 2 has no LRU cache in the standard library,
+    # so simply remember all the results there
+    # noinspection PyUnusedLocal
+    def lru_cache(maxsize=128):
+        """Unbounded replacement for the `functools.lru_cache`"""
+        return memoized
+
 LOG = get_named_logger(__name__, __file__)
 
 
+def move_to_end(ordered_dict, key):
+    """Mark the existing key of the OrderedDict as the most recently used"""
+    try:
+        ordered_dict.move_to_end(key)
+    except AttributeError:  # pragma: no cover
+        # Python 2
+        ordered_dict[key] = ordered_dict.pop(key)
+
+
 class Cache(object):
     """
     Presents the simple dictionary
     with size limit and hit counter.
     """
 
-    def __init__(self, max_size=10 ** 5, increase=False, do_not_increase_after=10 ** 6):
+    def __init__(self, max_size=10 ** 5, increase=False, do_not_increase_after=10 ** 6,
+                 lru=False):
         """
         :param max_size: maximum number of items that the cache can store
         :param increase: whether to increase the size dynamically when reached the max.
@@ -28,12 +58,16 @@ class Cache(object):
         the size will be multiplied by that amount.
         :param do_not_increase_after: prevent the cache from growing
         at certain number of items
+        :param lru: when the max size reached, evict the least recently used items
+        instead of clearing the whole cache (the size does not increase then)
         """
-        self._storage = dict()
+        self.lru = lru
+        self._storage = OrderedDict() if lru else dict()
         self.init_size = max_size
         self.max_size = max_size
         self.hits = 0
         self.total_queries = 0
+        self.evictions = 0
 
         if increase is True:
             increase = 2
@@ -50,13 +84,21 @@ class Cache(object):
         """Write the value to cache."""
 
         if len(self) >= self.max_size:
-            LOG.warning('Maximum size for cache reached (%s).', self.max_size)
+            if self.lru:
+                self._evict()
+            else:
+                LOG.warning('Maximum size for cache reached (%s).', self.max_size)
 
-            self._clear()
-            self._increase_size()
+                self._clear()
+                self._increase_size()
 
         self._save(name, value, **kwargs)
 
+    def _evict(self):
+        """Drop the least recently used item"""
+        self._storage.popitem(last=False)
+        self.evictions += 1
+
     # noinspection PyUnusedLocal
     def _save(self, name, value, **kwargs):
         self._storage[name] = value
@@ -74,7 +116,10 @@ class Cache(object):
         return value
 
     def _get(self, name):
-        return self._storage.get(name)
+        value = self._storage.get(name)
+        if self.lru and value is not None:
+            move_to_end(self._storage, name)
+        return value
 
     def _increase_size(self):
         if self.max_size >= self.do_not_increase_after:
@@ -99,6 +144,102 @@ class Cache(object):
         return float(self.hits) / self.total_queries
 
 
+class PersistentCache(Cache):
+    """
+    The cache that keeps all the saved items in the SQLite database,
+    so they are available on the next run of the program.
+
+    The in-memory storage serves as the first level:
+    the new items are written to the disk in batches
+    (when the memory limit reached, or on `flush`, or on exit).
+    """
+
+    def __init__(self, path, table, *args, **kwargs):
+        super(PersistentCache, self).__init__(*args, **kwargs)
+
+        dir_name = os.path.dirname(path)
+        if dir_name and not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+
+        self.path = path
+        self.table = table
+        self._pending = dict()
+
+        self._connection = None
+        self._connection_pid = None
+        self._connect()
+
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """
+        Open the connection for the current process.
+
+        The SQLite connection cannot be used after the `fork`,
+        so the forked processes (e.g. the parallel probes) open their own.
+        """
+        pid = os.getpid()
+        if self._connection_pid == pid:
+            return self._connection
+
+        # the solving can be run in a separate thread (e.g. with the curses animation)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection_pid = pid
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS "{}" '
+            '(key BLOB PRIMARY KEY, value BLOB)'.format(self.table))
+        return self._connection
+
+    @classmethod
+    def _hash(cls, name):
+        return sqlite3.Binary(hashlib.sha1(repr(name).encode('utf-8')).digest())
+
+    def _save(self, name, value, **kwargs):
+        super(PersistentCache, self)._save(name, value, **kwargs)
+        self._pending[name] = value
+
+    def _get(self, name):
+        value = super(PersistentCache, self)._get(name)
+        if value is not None:
+            return value
+
+        row = self._connect().execute(
+            'SELECT value FROM "{}" WHERE key = ?'.format(self.table),
+            (self._hash(name),)).fetchone()
+        if row is None:
+            return None
+
+        value = pickle.loads(bytes(row[0]))
+        # do not write it back to the disk
+        super(PersistentCache, self)._save(name, value)
+        return value
+
+    def _clear(self):
+        self.flush()
+        super(PersistentCache, self)._clear()
+
+    def flush(self):
+        """Write all the new items to the disk"""
+        if not self._pending:
+            return
+
+        connection = self._connect()
+        connection.executemany(
+            'INSERT OR REPLACE INTO "{}" (key, value) VALUES (?, ?)'.format(self.table),
+            [(self._hash(name), sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+             for name, value in self._pending.items()])
+        connection.commit()
+
+        LOG.info('%i items written to %r', len(self._pending), self.path)
+        self._pending.clear()
+
+    def delete(self, name):
+        self._pending.pop(name, None)
+        self._connect().execute(
+            'DELETE FROM "{}" WHERE key = ?'.format(self.table), (self._hash(name),))
+        return super(PersistentCache, self).delete(name)
+
+
 # noinspection SpellCheckingInspection
 # https://english.stackexchange.com/a/312087
 class ExpirableCache(Cache):
@@ -167,6 +167,16 @@ def _two_powers(num):
         num = rest
 
 
+def is_power_of_two(num):
+    """
+    Whether the number has exactly one bit set,
+    i.e. the color is a single one (not a combination of several colors)
+
+    https://stackoverflow.com/a/600306
+    """
+    return num > 0 and not num & (num - 1)
+
+
 def from_two_powers(numbers):
     """
     Construct a number from the powers of 2
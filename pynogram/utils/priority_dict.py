@@ -9,6 +9,8 @@ from heapq import heapify, heappush, heappop
 
 from six import iteritems
 
+_MISSING = object()
+
 
 class PriorityDict(dict):
     """
@@ -54,20 +56,30 @@ class PriorityDict(dict):
         """
 
         heap = self._heap
+        get = self.get
         val, key = heappop(heap)
-        while key not in self or self[key] != val:
+        # skip the outdated entries: the removed keys
+        # or the keys whose priority was changed
+        while get(key) != val:
             val, key = heappop(heap)
         del self[key]
         return key, val
 
     def __setitem__(self, key, val):
+        # The entry with the same priority is already in the heap,
+        # so do not push the duplicate that will be skipped anyway.
+        if self.get(key, _MISSING) == val:
+            return
+
         # We are not going to remove the previous value from the heap,
         # since this would have a cost O(n).
 
-        super(PriorityDict, self).__setitem__(key, val)
+        # the items are set for every job, so do not create the `super` object
+        dict.__setitem__(self, key, val)
 
-        if len(self._heap) < 2 * len(self):
-            heappush(self._heap, (val, key))
+        heap = self._heap
+        if len(heap) < 2 * len(self):
+            heappush(heap, (val, key))
         else:
             # When the heap grows larger than 2 * len(self), we rebuild it
             # from scratch to avoid wasting too much memory.
@@ -93,5 +105,11 @@ class PriorityDict(dict):
         Beware: this will destroy elements as they are returned.
         """
 
+        # the same as the `pop_smallest` in a loop, but without a call per item
+        get = self.get
         while self:
-            yield self.pop_smallest()
+            # the heap can be rebuilt while iterating, so do not cache it
+            val, key = heappop(self._heap)
+            if get(key) == val:
+                del self[key]
+                yield key, val
@@ -11,6 +11,8 @@ from pynogram.core.common import (
     UNKNOWN, BOX, SPACE,
     invert,
 )
+from pynogram.core.line.base import UNCHANGED
+from pynogram.core.line.bgu import BguSolver
 
 
 def test_space_hints_solving():
@@ -33,3 +35,13 @@ def test_invert():
     assert invert(SPACE) is BOX
     assert invert(BOX) is SPACE
     assert invert(UNKNOWN) is UNKNOWN
+
+
+def test_unchanged_line_cached():
+    desc, line = (1, 1), (UNKNOWN, UNKNOWN, SPACE, UNKNOWN, UNKNOWN)
+
+    assert BguSolver.solve(desc, line) is line
+    assert BguSolver.solutions_cache.get((desc, line)) is UNCHANGED
+
+    # the cached value gives the same line back
+    assert BguSolver.solve(desc, line) is line
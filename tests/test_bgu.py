@@ -10,13 +10,19 @@ from pynogram.core.board import (
 )
 from pynogram.core.color import ColorBlock
 from pynogram.core.common import (
+    UNKNOWN, BOX, SPACE,
     NonogramError,
     BlottedBlock,
 )
 from pynogram.core.line import solve_line
 from pynogram.core.line.bgu import (
+    BguSolver,
+    BguBlottedSolver,
     BguColoredSolver,
     BguColoredBlottedSolver,
+    block_sums,
+    count_placements,
+    solve_blocks,
 )
 from pynogram.reader import (
     read_example,
@@ -44,6 +50,72 @@ class TestBguSolver(object):
         propagation.solve(board, methods='bgu')
         assert board.is_solved_full
 
+    def test_line_masks(self):
+        solver = BguSolver((1, 1), (BOX, UNKNOWN, SPACE, UNKNOWN))
+
+        # the additional space appended
+        assert solver.space_mask == 0b10100
+        assert solver.box_mask == 0b00001
+
+    def test_block_sums(self):
+        assert BguSolver.calc_block_sum([2, 1, 3]) == (0, 1, 3, 7)
+        assert BguSolver.calc_block_sum((2, 1, 3)) is block_sums((2, 1, 3), False)
+
+    def test_solve_blocks(self):
+        # the line (UNKNOWN, UNKNOWN, SPACE, UNKNOWN) with the additional space
+        assert solve_blocks((2, 1), 0b10100, 0, 5) == (0b10100, 0b01011)
+        assert solve_blocks((1, 2), 0b10100, 0, 5) is None
+
+        # the line of 5 unknown cells with the additional space
+        assert solve_blocks((1, 2), 0b100000, 0, 6) == (0b110111, 0b011111)
+        assert solve_blocks((), 0b100000, 0, 6) == (0b111111, 0)
+        # the box at the last cell
+        assert solve_blocks((1, 2), 0, 0b100000, 6) is None
+
+    def test_count_placements(self):
+        # the line (UNKNOWN, UNKNOWN, SPACE, UNKNOWN)
+        assert count_placements((1,), 0b0100, 0, 4) == 3
+        assert count_placements((1, 1), 0b0100, 0, 4) == 2
+        assert count_placements((2, 1), 0b0100, 0, 4) == 1
+        assert count_placements((1, 2), 0b0100, 0, 4) == 0
+        assert count_placements((), 0b0100, 0, 4) == 1
+        assert count_placements((), 0, 0b0001, 4) == 0
+
+    def test_count_solutions(self):
+        assert BguSolver.count_solutions([1, 1], (UNKNOWN,) * 5) == 6
+        assert BguSolver.count_solutions([1, 1], (BOX,) + (UNKNOWN,) * 4) == 3
+        assert BguSolver.count_solutions([0], (UNKNOWN,) * 3) == 1
+        assert BguSolver.count_solutions([2], (SPACE, BOX, SPACE)) == 0
+
+    def test_solved_line(self):
+        line = (SPACE, BOX, BOX, SPACE, BOX)
+        # noinspection PyProtectedMember
+        assert tuple(BguSolver([2, 1], line)._solve()) == line
+
+        with pytest.raises(NonogramError, match='The solved line has blocks'):
+            # noinspection PyProtectedMember
+            BguSolver([1, 2], line)._solve()
+
+        # noinspection PyProtectedMember
+        assert tuple(BguSolver([0], (SPACE,) * 3)._solve()) == (SPACE,) * 3
+
+    def test_empty_description(self):
+        line = (UNKNOWN, SPACE, UNKNOWN)
+        # noinspection PyProtectedMember
+        assert BguSolver([], line)._solve() == [SPACE] * 3
+        # noinspection PyProtectedMember
+        assert BguSolver([0], line)._solve() == [SPACE] * 3
+
+        with pytest.raises(NonogramError, match='the description is empty'):
+            # noinspection PyProtectedMember
+            BguSolver([], (UNKNOWN, BOX))._solve()
+
+    def test_very_long_line(self):
+        # no recursion limit reached
+        line = (UNKNOWN,) * 4000
+        assert solve_line([3000], line, method='bgu') == (
+            (UNKNOWN,) * 1000 + (BOX,) * 2000 + (UNKNOWN,) * 1000)
+
 
 class TestBguColoredSolver(ColorTest):
     @classmethod
@@ -86,3 +158,30 @@ class TestBguColoredBlotted(object):
             [12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25],
             [24, 26, 27, 28, 29],
         ]
+
+    def test_feasible(self):
+        desc = (ColorBlock(2, 4), ColorBlock(1, 8))
+        assert BguColoredBlottedSolver._is_feasible(desc, (5, 5, 9, 13, 9))
+
+    def test_not_feasible_too_many_solved(self):
+        desc = (ColorBlock(2, 4), ColorBlock(1, 8))
+        assert not BguColoredBlottedSolver._is_feasible(desc, (4, 4, 4, 9, 9))
+
+    def test_not_feasible_not_enough_cells(self):
+        desc = (ColorBlock(2, 4), ColorBlock(1, 8))
+        assert not BguColoredBlottedSolver._is_feasible(desc, (5, 1, 9, 9, 9))
+
+
+class TestBguBlotted(object):
+    def test_feasible(self):
+        assert BguBlottedSolver._is_feasible((2, 1), (None, BOX, None, SPACE, None))
+
+    def test_not_feasible(self):
+        assert not BguBlottedSolver._is_feasible((2, 1), (BOX, BOX, SPACE, BOX, BOX))
+        assert not BguBlottedSolver._is_feasible((2, 1), (None, SPACE, SPACE, SPACE, None))
+
+    def test_solve(self):
+        desc = (BlottedBlock, 1)
+        line = (None, SPACE, None, BOX)
+        assert solve_line(desc, line, method='blot', normalized=True) == (
+            BOX, SPACE, SPACE, BOX)
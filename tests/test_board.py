@@ -7,15 +7,15 @@ from io import StringIO
 
 import pytest
 
-from pynogram.core import propagation
+from pynogram.core import backtracking, propagation
 from pynogram.core.backtracking import Solver
 from pynogram.core.board import (
-    BlackBoard, make_board,
+    BaseBoard, BlackBoard, CellState, SolvableGrid, make_board,
 )
 from pynogram.core.color import (
     ColorMap, Color,
 )
-from pynogram.core.common import BlottedBlock
+from pynogram.core.common import BlottedBlock, BOX, SPACE, SPACE_COLORED, UNKNOWN
 from pynogram.core.renderer import (
     BaseAsciiRenderer,
     AsciiRenderer,
@@ -83,6 +83,36 @@ class TestBoard(object):
             (),
         ])
 
+    def test_line_solution_rate(self):
+        line = [BOX, None, SPACE, None]
+        assert BlackBoard.line_solution_rate(line) == 0.5
+        assert BlackBoard.line_solution_rate(tuple(line), size=8) == 0.25
+        assert BlackBoard.line_solution_rate(iter(line)) == 0.5
+
+    def test_solution_rate(self, board):
+        assert board.solution_rate == 0
+
+        board.set_column(0, [SPACE] * board.height)
+        board.set_color((1, 1, BOX))
+        assert board.solution_rate == 12.0 / 88
+
+        propagation.solve(board)
+        assert board.solution_rate == 1
+
+    def test_column_solution_rate(self, board):
+        assert board.column_solution_rate(0) == 0
+        propagation.solve(board)
+        assert board.column_solution_rate(0) == 1
+
+    def test_lines_solution_rates(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+
+        assert board.rows_solution_rates() == [
+            board.row_solution_rate(index) for index in range(board.height)]
+        assert board.columns_solution_rates() == [
+            board.column_solution_rate(index) for index in range(board.width)]
+
     def test_bad_renderer(self):
         with pytest.raises(TypeError) as ei:
             # noinspection PyTypeChecker
@@ -288,6 +318,475 @@ class TestContradictions(object):
         Solver(board).solve()
         assert board.is_solved_full
 
+    def test_unsolved_cells(self):
+        columns, rows = read_example('smile.txt')
+        board = BlackBoard(columns, rows)
+        propagation.solve(board)
+
+        unsolved = list(board.unsolved_cells())
+        assert len(unsolved) == 8
+        assert not any(board.is_cell_solved(pos) for pos in unsolved)
+
+        Solver(board).solve()
+        assert list(board.unsolved_cells()) == []
+
+    def test_unsolved_neighbours_counts(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+
+        counts = board.unsolved_neighbours_counts()
+        assert sorted(counts) == sorted(board.unsolved_cells())
+        for pos, count in counts.items():
+            assert count == len(list(board.unsolved_neighbours(pos)))
+            assert count == board.unsolved_neighbours_count(pos)
+
+        # the generic implementation
+        assert SolvableGrid.unsolved_neighbours_counts(board) == counts
+
+    def test_unsolved_neighbours_counts_colored(self):
+        board = make_board(*color_board_def())
+
+        counts = SolvableGrid.unsolved_neighbours_counts(board)
+        assert sorted(counts) == sorted(board.unsolved_cells())
+        for pos, count in counts.items():
+            assert count == len(list(board.unsolved_neighbours(pos)))
+
+    def test_unsolved_neighbours_of(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+
+        positions = [(0, 0), (3, 5), (3, 6), (4, 5), (board.height - 1, board.width - 1)]
+        expected = set()
+        for pos in positions:
+            expected.update(board.unsolved_neighbours(pos))
+
+        neighbours = board.unsolved_neighbours_of(positions)
+        assert len(neighbours) == len(expected)
+        assert set(neighbours) == expected
+        # the generic implementation
+        assert sorted(BaseBoard.unsolved_neighbours_of(board, positions)) == sorted(neighbours)
+
+        assert board.unsolved_neighbours_of([]) == []
+
+    def test_probing_priorities(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+
+        priorities = board.probing_priorities()
+        assert sorted(priorities) == sorted(board.unsolved_cells())
+        # the same as the generic implementation
+        assert priorities == SolvableGrid.probing_priorities(board)
+        assert board.rows_solution_rates() == SolvableGrid.rows_solution_rates(board)
+        assert board.columns_solution_rates() == SolvableGrid.columns_solution_rates(board)
+
+        unsolved = list(priorities)[:3]
+        solved = next((i, j) for i in range(board.height) for j in range(board.width)
+                      if board.is_cell_solved((i, j)))
+        positions = [tuple(pos) for pos in unsolved] + [solved]
+        assert board.probing_priorities(positions) == dict(
+            (pos, priorities[pos]) for pos in unsolved)
+        assert SolvableGrid.probing_priorities(board, positions) == dict(
+            (pos, priorities[pos]) for pos in unsolved)
+
+    def test_changed(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        snapshot = board.make_snapshot()
+        assert list(board.changed(snapshot)) == []
+
+        unsolved = list(board.unsolved_cells())[:2]
+        for row_index, column_index in unsolved:
+            board.set_color((row_index, column_index, SPACE))
+
+        changed = list(board.changed(snapshot))
+        assert sorted(changed) == sorted(unsolved)
+        # the plain integers, not the numpy ones
+        assert {type(index) for pos in changed for index in pos} == {int}
+
+    def test_cell_colors(self):
+        board = make_board(*read_example('smile.txt'))
+        assert board.cell_colors((0, 0)) == {BOX, SPACE}
+
+        board.set_color((0, 0, SPACE))
+        board.set_color((0, 1, BOX))
+        assert board.cell_colors((0, 0)) == {SPACE}
+        assert board.cell_colors((0, 1)) == {BOX}
+
+    def test_diff(self):
+        old_cells = [[BOX, SPACE], [UNKNOWN, BOX], [SPACE, SPACE]]
+        new_cells = [[BOX, SPACE], [SPACE, BOX], [SPACE, SPACE]]
+
+        assert list(BlackBoard.diff(old_cells, new_cells)) == [(1, 0)]
+        assert list(BlackBoard.diff(old_cells, old_cells)) == []
+
+    def test_trail_rollback(self):
+        board = make_board(*read_example('smile.txt'))
+        propagation.solve(board)
+        snapshot = board.make_snapshot()
+
+        board.start_trail()
+        row_index, column_index = next(board.unsolved_cells())
+        board.set_color((row_index, column_index, BOX))
+        board.set_row(0, [SPACE] * board.width)
+        board.set_column(1, [BOX] * board.height)
+        board.rollback()
+
+        assert list(board.changed(snapshot)) == []
+        assert not board.is_cell_solved((row_index, column_index))
+
+    def test_nested_trails(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        snapshot = board.make_snapshot()
+        first, second = list(board.unsolved_cells())[:2]
+
+        checkpoint = board.start_trail()
+        board.set_color(first + (SPACE,))
+        guess = board.make_snapshot()
+
+        board.start_trail()
+        board.set_color(second + (SPACE,))
+        assert board.stop_trail() == [second]
+        assert list(board.changed(board.trail_snapshot(checkpoint))) == [first, second]
+
+        board.start_trail()
+        board.set_row(first[0], [SPACE] * board.width)
+        board.rollback()
+        assert board.is_cell_solved(second)
+        assert list(board.changed(guess)) == [second]
+
+        board.rollback()
+        assert list(board.changed(snapshot)) == []
+
+    def test_trail_snapshot_keeps_the_replaced_rows(self):
+        board = BlackBoard([1, 1, 0], [1, 1, 0])
+
+        checkpoint = board.start_trail()
+        board.set_color((0, 0, BOX))
+
+        board.start_trail()
+        board.set_row(0, [BOX, SPACE, SPACE])
+        assert board.trail_snapshot(checkpoint)[0] == [UNKNOWN] * 3
+
+        board.rollback()
+        assert board.cells[0] == [BOX, UNKNOWN, UNKNOWN]
+
+    def test_stop_trail(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        snapshot = board.make_snapshot()
+
+        board.start_trail()
+        row_index, column_index = next(board.unsolved_cells())
+        board.set_color((row_index, column_index, SPACE))
+        row = list(board.get_row(row_index))
+        board.set_row(row_index, [SPACE if cell is None else cell for cell in row])
+        column = list(board.get_column(column_index + 1))
+        board.set_column(column_index + 1, [BOX if cell is None else cell for cell in column])
+        changed = board.stop_trail()
+
+        assert sorted(changed) == sorted(board.changed(snapshot))
+        assert (row_index, column_index) in changed
+
+    # noinspection PyProtectedMember
+    def test_dead_prefix(self):
+        columns, rows = read_example('smile.txt')
+        board = BlackBoard(columns, rows)
+        propagation.solve(board)
+        solver = Solver(board)
+
+        snapshot = board.make_snapshot()
+        root = board.start_trail()
+
+        solver._guess_checkpoints = [root, board.start_trail()]
+        solver._find_dead_prefix((1, 0))
+        assert solver._dead_depth is None
+
+        # the second row should be empty
+        board.set_row(1, [BOX] * board.width)
+        solver._guess_checkpoints = [root, board.start_trail()]
+        solver._find_dead_prefix((1, 0))
+        assert solver._dead_depth == 1
+        # the current board is intact
+        assert board.get_row(1) == [BOX] * board.width
+
+        for __ in range(3):
+            board.rollback()
+        assert list(board.changed(snapshot)) == []
+
+    # noinspection PyProtectedMember
+    def test_dead_ends(self, monkeypatch):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        monkeypatch.setattr(backtracking, 'PRUNE_DEAD_ENDS', True)
+        solver = Solver(board)
+        solver._add_search_result((), board.solution_rate)
+
+        first, second, third = [CellState.from_position(pos, BOX)
+                                for pos in list(board.unsolved_cells())[:3]]
+        solver._add_dead_end((first, second))
+        assert solver._is_dead_end((second, first))
+        assert solver._is_dead_end((third, second, first))
+        assert not solver._is_dead_end((first, third))
+
+        snapshot = board.make_snapshot()
+        assert solver._try_state(first, (third, second)) is False
+        # not even tried
+        assert list(board.changed(snapshot)) == []
+
+    # noinspection PyProtectedMember
+    def test_search_level_rolls_back(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+        solver._add_search_result((), board.solution_rate)
+        snapshot = board.make_snapshot()
+
+        first, second, third = [CellState.from_position(pos, BOX)
+                                for pos in list(board.unsolved_cells())[:3]]
+        solver.search([second, third], path=(first,))
+        assert list(board.changed(snapshot)) == []
+        assert board._trail is None
+
+    # noinspection PyProtectedMember
+    def test_skip_low_rated(self, monkeypatch):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+
+        monkeypatch.setattr(backtracking, 'SKIP_LOW_RATED', None)
+        all_jobs = dict(solver._get_all_unsolved_jobs())
+        assert all_jobs == board.probing_priorities()
+
+        monkeypatch.setattr(backtracking, 'SKIP_LOW_RATED', 0.2)
+        jobs = dict(solver._get_all_unsolved_jobs())
+        assert jobs == dict((pos, priority) for pos, priority in all_jobs.items()
+                            if priority <= 7.8)
+        assert dict(solver._get_all_unsolved_jobs(list(all_jobs))) == jobs
+
+        # all the cells are low rated
+        monkeypatch.setattr(backtracking, 'SKIP_LOW_RATED', 10)
+        assert dict(solver._get_all_unsolved_jobs()) == all_jobs
+
+    # noinspection PyProtectedMember
+    def test_path_key(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+
+        first, second, third = [CellState.from_position(pos, BOX)
+                                for pos in list(board.unsolved_cells())[:3]]
+        assert solver._path_key(()) == 0
+        assert solver._path_key((first, second)) == solver._path_key((second, first))
+        assert solver._path_key((first, second)) != solver._path_key((first, third))
+        assert solver._path_key((first, second, third)) == (
+            solver._path_key((first, second)) ^ solver._state_key(third))
+
+    # noinspection PyProtectedMember
+    def test_explored_states(self, monkeypatch):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+
+        searched = []
+
+        def _search(states, path, path_key):
+            searched.append(path)
+            return False
+
+        monkeypatch.setattr(solver, '_search', _search)
+
+        first, second = [CellState.from_position(pos, BOX)
+                         for pos in list(board.unsolved_cells())[:2]]
+        assert solver.search([], path=(first, second)) is False
+        # the same board can be searched deeper from the shallower depth
+        assert solver.search([], path=(second,)) is False
+        # the same board on the other path
+        assert solver.search([], path=(second, first)) is False
+        assert searched == [(first, second), (second,)]
+
+    def test_parallel_probes(self, monkeypatch):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        rate = board.solution_rate
+
+        monkeypatch.setattr(backtracking, 'PROBING_PROCESSES', 2)
+        solver = Solver(board)
+        assert solver._can_probe_in_parallel()
+
+        solver._solve_in_parallel()
+        assert board.solution_rate > rate
+
+        solver.solve()
+        assert board.is_solved_full
+
+    def test_parallel_probes_in_search(self, monkeypatch):
+        board = make_board(*read_example('xmas.txt'))
+        Solver(board, max_solutions=2).solve()
+        solutions = board.solutions
+
+        monkeypatch.setattr(backtracking, 'PROBING_PROCESSES', 2)
+        monkeypatch.setattr(backtracking, 'PARALLEL_PROBING_MIN_CELLS', 0)
+        board = make_board(*read_example('xmas.txt'))
+        Solver(board, max_solutions=2).solve()
+        assert len(board.solutions) == len(solutions) == 2
+
+    def test_fruitless_probes_limit(self, monkeypatch):
+        monkeypatch.setattr(backtracking, 'MAX_FRUITLESS_PROBES', 3)
+
+        # the search should try the unprobed cells too
+        board = make_board(*read_example('xmas.txt'))
+        Solver(board, max_solutions=2).solve()
+        assert len(board.solutions) == 2
+
+    def test_probes_cache(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+        snapshot = board.make_snapshot()
+
+        def restore():
+            board.restore([list(row) for row in snapshot])
+
+        states = [CellState.from_position(pos, color)
+                  for pos in board.unsolved_cells()
+                  for color in board.cell_colors(pos)]
+
+        results = []
+        for state in states:
+            restore()
+            results.append((solver.probe(state), board.make_snapshot()))
+        assert any(is_contradiction for (is_contradiction, __), __ in results)
+
+        def no_propagation(*args):
+            raise AssertionError('The probe should be taken from the cache')
+
+        solver.propagate_change = no_propagation
+        for state, (result, cells) in zip(states, results):
+            restore()
+            assert solver.probe(state) == result
+            assert list(board.changed(cells)) == []
+
+    # noinspection PyProtectedMember
+    def test_priorities_cache(self, monkeypatch):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        monkeypatch.setattr(backtracking, 'SKIP_LOW_RATED', None)
+        solver = Solver(board)
+
+        jobs = solver._get_all_unsolved_jobs()
+        assert jobs == board.probing_priorities()
+        jobs.pop_smallest()
+
+        probing_priorities = board.probing_priorities
+        board.probing_priorities = None
+        assert solver._get_all_unsolved_jobs() == probing_priorities()
+
+        board.set_color(next(board.unsolved_cells()) + (SPACE,))
+        board.probing_priorities = probing_priorities
+        assert solver._get_all_unsolved_jobs() == probing_priorities()
+
+    def test_probes_cache_without_contradiction_results(self, monkeypatch):
+        monkeypatch.setattr(backtracking, 'USE_CONTRADICTION_RESULTS', False)
+
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+
+        probe = solver.probe
+        fingerprints = []
+
+        def checked_probe(state, fingerprint=None, **kwargs):
+            if fingerprint is not None:
+                fingerprints.append(fingerprint == board.fingerprint())
+            return probe(state, fingerprint=fingerprint, **kwargs)
+
+        monkeypatch.setattr(solver, 'probe', checked_probe)
+        solver.solve()
+        assert board.is_solved_full
+        # the probes are never cached for the board changed by the contradiction
+        assert fingerprints
+        assert all(fingerprints)
+
+    def test_leads_to_contradiction(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+        snapshot = board.make_snapshot()
+
+        states = [CellState.from_position(pos, color)
+                  for pos in board.unsolved_cells()
+                  for color in board.cell_colors(pos)]
+        contradictions = [state for state in states if solver.leads_to_contradiction(state)]
+        assert contradictions
+        assert list(board.changed(snapshot)) == []
+
+        for state in states:
+            board.restore([list(row) for row in snapshot])
+            is_contradiction, __ = solver.probe(state)
+            assert is_contradiction == (state in contradictions)
+
+    def test_probe_with_fingerprint(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+
+        snapshot = board.make_snapshot()
+        fingerprint = board.fingerprint()
+
+        state = CellState.from_position(next(board.unsolved_cells()), BOX)
+        result = solver.probe(state, fingerprint=fingerprint)
+        board.restore([list(row) for row in snapshot])
+
+        def no_fingerprint():
+            raise AssertionError('The given fingerprint should be used')
+
+        board.fingerprint = no_fingerprint
+        solver.propagate_change = None
+        assert solver.probe(state, fingerprint=fingerprint) == result
+
+    # noinspection PyProtectedMember
+    def test_new_jobs_from_solution(self):
+        board = make_board(*read_example('football.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+
+        pos = next(board.unsolved_cells())
+        changed = list(board.unsolved_neighbours(pos)) + [pos]
+        jobs = solver._new_jobs_from_solution(
+            CellState.from_position(pos, BOX), changed, False)
+
+        neighbours = set(board.unsolved_neighbours(pos))
+        assert set(jobs) >= neighbours
+        for job, priority in jobs.items():
+            assert priority == (0 if job in neighbours else 1)
+
+    # noinspection PyProtectedMember
+    def test_max_candidates(self, monkeypatch):
+        board = make_board(*read_example('xmas.txt'))
+        propagation.solve(board)
+        solver = Solver(board)
+        # the lower rows have the higher rates
+        rates = dict(
+            (CellState.from_position(pos, color), (pos[0], 0))
+            for pos in board.unsolved_cells()
+            for color in board.cell_colors(pos))
+
+        all_candidates = solver._probes_from_rates(rates)
+        monkeypatch.setattr(backtracking, 'MAX_CANDIDATES', 3)
+        candidates = solver._probes_from_rates(rates)
+
+        assert len(set(state.position for state in candidates)) == 3
+        assert candidates == all_candidates[:len(candidates)]
+
+    @pytest.mark.parametrize('use_numpy', [False, True])
+    def test_mrv_candidates(self, monkeypatch, use_numpy):
+        monkeypatch.setattr(backtracking, 'MRV_CANDIDATES', True)
+
+        board = make_board(*read_example('xmas.txt'), use_numpy=use_numpy)
+        Solver(board, max_solutions=2).solve()
+        assert len(board.solutions) == 2
+
     def test_simple(self):
         board = tested_board()
         Solver(board).solve()
@@ -308,6 +807,25 @@ class TestContradictions(object):
         assert is_close(board.solution_rate, 7.0 / 9)
         assert len(board.solutions) == 2
 
+    # noinspection PyProtectedMember
+    def test_guess_solves_the_board(self):
+        columns = [3, 1, 2, 2, '1 1', '1 1']
+        rows = ['1 2', 1, 1, 3, 2, 2]
+
+        board = BlackBoard(columns, rows)
+        solver = Solver(board)
+        solver._solve_without_search(to_the_max=True)
+        solver._add_search_result((), board.solution_rate)
+
+        def no_probes(*args, **kwargs):
+            raise AssertionError('The solved board should not be probed')
+
+        solver._solve_jobs = no_probes
+
+        pos = next(board.unsolved_cells())
+        assert solver._try_state(CellState.from_position(pos, BOX), ())
+        assert board.is_solved_full
+
     def test_chessboard(self):
         # The real chessboard could be defined like this
         #
@@ -429,6 +947,12 @@ class TestMakeBoard(object):
     def test_colored(self, color_board):
         assert color_board.is_colored
 
+    # noinspection PyShadowingNames
+    def test_default_methods(self, color_board):
+        board = make_board(*read_example('smile.txt'))
+        assert propagation.default_methods(board) == ('bgu',)
+        assert propagation.default_methods(color_board) == ('bgu_color',)
+
     def test_bad_make_board(self):
         with pytest.raises(ValueError, match='Bad number of \*args'):  # noqa: W605
             make_board(color_board_def()[0])
@@ -460,6 +984,45 @@ class TestColorBoard(object):
 
         assert set(board.columns_descriptions[14:17]) == {((15, 8),)}
 
+    def test_is_solved_full(self):
+        board = make_board(*color_board_def())
+        assert not board.is_solved_full
+
+        propagation.solve(board)
+        assert board.is_solved_full
+
+        board.cells[0][0] = board.init_cell_state
+        assert not board.is_solved_full
+
+    def test_unset_color(self):
+        board = make_board(*color_board_def())
+        red = board.color_map.find_by_name('r').id_
+        blue = board.color_map.find_by_name('b').id_
+
+        # the first row can only be red or empty
+        with pytest.raises(ValueError, match='Cannot unset the colors'):
+            board.unset_color((0, 0, blue))
+
+        board.unset_color((0, 0, red))
+        assert board.cell_colors((0, 0)) == {SPACE_COLORED}
+
+        with pytest.raises(ValueError, match='Cannot unset the colors'):
+            board.unset_color((0, 0, SPACE_COLORED))
+
+    def test_solution_rate(self):
+        board = make_board(*color_board_def())
+        # the same as the average rate of the rows
+        assert is_close(board.solution_rate, SolvableGrid.solution_rate.fget(board))
+
+        board.unset_color((0, 0, SPACE_COLORED))
+        board.unset_color((0, 1, SPACE_COLORED))
+        assert is_close(board.solution_rate, SolvableGrid.solution_rate.fget(board))
+        assert board.rows_solution_rates() == SolvableGrid.rows_solution_rates(board)
+        assert board.columns_solution_rates() == SolvableGrid.columns_solution_rates(board)
+
+        propagation.solve(board)
+        assert board.solution_rate == 1
+
     def test_colors(self):
         board = make_board(*color_board_def())
         assert board.symbol_for_color_id('r') == 'X'
@@ -563,6 +1126,12 @@ class TestColorBoard(object):
         assert board.is_solved_full
         assert board.is_finished
 
+    def test_unsolved_cells(self, board):
+        assert len(list(board.unsolved_cells())) == board.width * board.height
+
+        Solver(board).solve()
+        assert list(board.unsolved_cells()) == []
+
     def test_solve_contradictions(self):
         board = make_board(*Pbn.read(2021))
         Solver(board).solve()
@@ -2,12 +2,14 @@
 
 from __future__ import unicode_literals, print_function
 
+import os
 import time
 
 from pynogram.core.line.base import TwoLayerCache
 from pynogram.utils.cache import (
     Cache,
     ExpirableCache,
+    PersistentCache,
 )
 
 
@@ -32,6 +34,21 @@ class TestCache(object):
         assert c.get('foo') is None
         assert c.max_size == 20
 
+    def test_lru(self):
+        c = Cache(10, lru=True)
+        c.save('foo', 42)
+
+        for i in range(20):
+            assert c.get('foo') == 42
+            c.save(i, i)
+
+        # the recently used item is still here, the others are evicted one by one
+        assert len(c) == 10
+        assert c.max_size == 10
+        assert c.evictions == 11
+        assert c.get(10) is None
+        assert c.get(11) == 11
+
     def test_expiration(self):
         c = ExpirableCache(10)
         c.save('foo', 42, time=0.000001)
@@ -111,7 +128,82 @@ class TestCache(object):
         assert c.get(('foo', 'baz')) == 2
         assert c.delete(('foo', 'baz')) is True
         assert c.get(('foo', 'baz')) is None
+        assert c.delete(('foo', 'baz')) is False
+
+        # overwrite the value
+        c.save(('foo', 'bar'), 3)
+        assert c.get(('foo', 'bar')) == 3
 
         assert len(c) == 1
         # noinspection PyProtectedMember
         assert list(c._storage) == ['foo']
+
+    def test_persistent(self, tmpdir):
+        path = str(tmpdir.join('cache', 'lines.db'))
+
+        c = PersistentCache(path, 'Solver')
+        c.save(((1, 2), (None, True)), (True, False))
+        c.save(((1, 2), (False, False)), False)
+        c.flush()
+
+        # the new instance reads everything from the disk
+        c = PersistentCache(path, 'Solver')
+        assert c.get(((1, 2), (None, True))) == (True, False)
+        assert c.get(((1, 2), (False, False))) is False
+        assert c.get(((1, 2), (None, None))) is None
+
+        # another table in the same file
+        assert PersistentCache(path, 'OtherSolver').get(((1, 2), (None, True))) is None
+
+    def test_persistent_flush_on_clear(self, tmpdir):
+        path = str(tmpdir.join('lines.db'))
+
+        c = PersistentCache(path, 'Solver', 2)
+        for i in range(3):
+            c.save(i, i * 10)
+
+        # the memory cleared, but the items are still on the disk
+        assert len(c) == 1
+        assert c.get(0) == 0
+        assert c.get(1) == 10
+
+    # noinspection PyProtectedMember
+    def test_persistent_connection_per_process(self, tmpdir, monkeypatch):
+        path = str(tmpdir.join('lines.db'))
+
+        c = PersistentCache(path, 'Solver')
+        c.save(0, 'foo')
+        # only the disk has the item
+        c._clear()
+        connection = c._connection
+
+        # as if the cache is used in the forked process
+        monkeypatch.setattr(os, 'getpid', lambda: -1)
+        assert c.get(0) == 'foo'
+        assert c._connection is not connection
+
+    def test_nonogram_cache_capacity(self):
+        c = TwoLayerCache(4)
+        for i in range(4):
+            c.save(('foo', i), i)
+        assert len(c) == 4
+
+        c.save(('bar', 0), 0)
+        assert len(c) == 1
+        assert c.get(('foo', 0)) is None
+
+    def test_nonogram_cache_lru(self):
+        c = TwoLayerCache(4, lru=True)
+        c.save(('foo', 0), 0)
+        c.save(('bar', 0), 0)
+        c.save(('bar', 1), 1)
+        c.save(('baz', 0), 0)
+
+        assert c.get(('foo', 0)) == 0
+
+        # all the solutions for the least recently used clue are evicted
+        c.save(('qux', 0), 0)
+        assert len(c) == 3
+        assert c.evictions == 2
+        assert c.get(('bar', 0)) is None
+        assert c.get(('foo', 0)) == 0
@@ -10,11 +10,14 @@ from pynogram.core.board import (
 )
 from pynogram.core.color import ColorBlock
 from pynogram.core.common import (
-    SPACE, SPACE_COLORED as SPACE_C,
+    UNKNOWN, BOX, SPACE, SPACE_COLORED as SPACE_C,
     NonogramError,
 )
 from pynogram.core.line import solve_line
-from pynogram.core.line.efficient import EfficientColorSolver
+from pynogram.core.line.efficient import (
+    EfficientSolver,
+    EfficientColorSolver,
+)
 from pynogram.reader import (
     read_example,
     Pbn,
@@ -36,6 +39,49 @@ class TestFastSolver(object):
         with pytest.raises(NonogramError):
             solve_line(description, input_row, method='efficient')
 
+    def test_line_masks(self):
+        solver = EfficientSolver([2], (SPACE, UNKNOWN, BOX, UNKNOWN, SPACE))
+        # the space was not prepended
+        assert not solver.additional_space
+
+        assert solver._can_space == 0b11011
+        assert solver._can_box == 0b01110
+
+    def test_long_block(self):
+        line = (UNKNOWN,) * 30 + (BOX,) + (UNKNOWN,) * 30
+        assert solve_line([60], line, method='efficient') == (
+            (UNKNOWN,) + (BOX,) * 59 + (UNKNOWN,))
+
+    def test_very_long_line(self):
+        # the table is filled without recursion
+        line = (UNKNOWN,) * 4999 + (SPACE,)
+        assert solve_line([4000], line, method='efficient') == (
+            (UNKNOWN,) * 999 + (BOX,) * 3001 + (UNKNOWN,) * 999 + (SPACE,))
+
+    def test_unknown_line(self):
+        line = (UNKNOWN,) * 10
+        # noinspection PyProtectedMember
+        assert EfficientSolver([3, 4], line)._solve_trivial() == [
+            UNKNOWN, UNKNOWN, BOX, UNKNOWN, UNKNOWN, UNKNOWN, BOX, BOX, UNKNOWN, UNKNOWN]
+
+        # noinspection PyProtectedMember
+        assert EfficientSolver([1, 2], line[:4])._solve_trivial() == [
+            BOX, SPACE, BOX, BOX]
+
+        # noinspection PyProtectedMember
+        assert EfficientSolver([], line)._solve_trivial() == [SPACE] * 10
+        # noinspection PyProtectedMember
+        assert EfficientSolver([0], line)._solve_trivial() == [SPACE] * 10
+
+    def test_solved_line(self):
+        line = (SPACE, BOX, BOX, SPACE, BOX)
+        # noinspection PyProtectedMember
+        assert EfficientSolver([2, 1], line)._solve_trivial() == line
+
+        with pytest.raises(NonogramError, match='The solved line has blocks'):
+            # noinspection PyProtectedMember
+            EfficientSolver([1, 2], line)._solve_trivial()
+
     def test_solve_board(self):
         columns, rows = read_example('p')
 
@@ -14,6 +14,8 @@ from pynogram.core.common import (
 from pynogram.core.line import solve_line
 from pynogram.core.line.machine import (
     BaseMachineSolver,
+    ReverseTrackingColoredSolver,
+    TransitionLayer,
     assert_match,
 )
 from pynogram.utils.fsm import (
@@ -173,18 +175,45 @@ class TestNonogramFiniteStateMachine(object):
         assert nfsm.states == (1,)
         assert len(nfsm.actions) == 1
 
-        # if the description is empty, the previous state_map
-        # from the ColoredNfsm can be cached, so we can receive SPACE_COLORED here
+        # the state maps are cached separately for every type of machine,
+        # so the one from the colored machine never appears here
         action = nfsm.actions[0]
-        assert action in (SPACE, SPACE_COLORED)
+        assert action == SPACE
         assert dict(nfsm.state_map) == {(1, action): 1}
 
+        colored = ReverseTrackingColoredSolver.make_nfsm()
+        assert dict(colored.state_map) == {(1, SPACE_COLORED): 1}
+
+    def test_can_be_empty(self):
+        nfsm = self.fsm()
+        assert nfsm._can_be_empty((UNKNOWN, SPACE, UNKNOWN))
+        assert not nfsm._can_be_empty((UNKNOWN, BOX, SPACE))
+
+        colored = ReverseTrackingColoredSolver.make_nfsm()
+        assert colored._can_be_empty((SPACE_COLORED, 5, 7))
+        assert not colored._can_be_empty((SPACE_COLORED, 6, 7))
+
     def test_matches(self, nfsm):
         assert nfsm.match([BOX, BOX, BOX, SPACE, BOX, BOX])
 
     def test_not_matches(self, nfsm):
         assert not nfsm.match([BOX, BOX, SPACE, BOX, BOX, BOX])
 
+    def test_match_does_not_change_state(self, nfsm):
+        assert nfsm.match([BOX, BOX, BOX, SPACE, BOX, BOX])
+        assert nfsm.current_state == nfsm.initial_state
+
+        assert not nfsm.match([BOX, SPACE])
+        assert nfsm.current_state == nfsm.initial_state
+
+    def test_shared(self):
+        nfsm = BaseMachineSolver.shared_nfsm((3, 2))
+        assert BaseMachineSolver.shared_nfsm([3, 2]) is nfsm
+        assert BaseMachineSolver((3, 2), (UNKNOWN,) * 6).nfsm is nfsm
+
+        # a fresh machine every time
+        assert BaseMachineSolver.make_nfsm((3, 2)) is not nfsm
+
     def test_match_not_in_initial(self, nfsm):
         nfsm.transition(BOX)
         with pytest.raises(RuntimeError, match="Only run 'match' when in initial state"):
@@ -316,6 +345,21 @@ class TestNonogramFSMReverseTracking(TestNonogramFiniteStateMachine):
             '(6): [5<-True, 6<-False]',
         ])
 
+    def test_transition_layer_reverse_index(self):
+        layer = TransitionLayer()
+        layer.append(1, 1, False)
+        layer.append(2, 1, True)
+        layer.append(2, 2, False)
+
+        assert layer.reverse_index() == {
+            1: [(1, False)],
+            2: [(1, True), (2, False)],
+        }
+
+        # the index rebuilds after the new transition
+        layer.append(3, 2, True)
+        assert layer.reverse_index()[3] == [(2, True)]
+
     def test_solve_bad_row(self):
         with pytest.raises(NonogramError) as ie:
             solve_line('1 1', '__.', method='reverse_tracking')
@@ -20,6 +20,7 @@ from pynogram.utils.iter import (
 from pynogram.utils.other import (
     get_version,
     two_powers, from_two_powers,
+    is_power_of_two,
 )
 from pynogram.utils.priority_dict import PriorityDict
 
@@ -193,6 +194,28 @@ class TestPriorityDict(object):
     def test_sorted(self, p_dict):
         assert [k for k, v in p_dict.sorted_iter()] == ['foo', 'baz', 'bar']
 
+    def test_sorted_with_updates(self, p_dict):
+        res = []
+        for key, val in p_dict.sorted_iter():
+            res.append((key, val))
+            if key == 'foo':
+                p_dict['baz'] = 1
+                # the heap gets rebuilt here
+                p_dict['baz'] = 0
+                p_dict['new'] = 5
+
+        assert res == [('foo', 1), ('baz', 0), ('bar', 3), ('new', 5)]
+        assert not p_dict
+
+    # noinspection PyProtectedMember
+    def test_same_priority(self, p_dict):
+        heap_size = len(p_dict._heap)
+        p_dict['foo'] = 1
+        p_dict['bar'] = 3
+        assert len(p_dict._heap) == heap_size
+
+        assert [k for k, v in p_dict.sorted_iter()] == ['foo', 'baz', 'bar']
+
     def test_set_default(self, p_dict):
         assert 'tutu' not in p_dict
         assert p_dict.setdefault('tutu', 5) == 5
@@ -355,6 +378,16 @@ class TestPowers(object):
             factors = two_powers(n)
             assert from_two_powers(factors) == n
 
+    def test_is_power_of_two(self):
+        assert not is_power_of_two(0)
+        assert is_power_of_two(1)
+        assert is_power_of_two(64)
+        assert not is_power_of_two(42)
+
+        for i in range(100):
+            n = random.randint(1, 10 ** 9)
+            assert is_power_of_two(n) == (len(two_powers(n)) == 1)
+
 
 class TestMaxInterval(object):
     def test_empty(self):